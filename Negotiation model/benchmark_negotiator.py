@@ -0,0 +1,143 @@
+"""Compare tokens/sec and memory of the negotiator's loading modes on this machine.
+
+Each mode is measured in a fresh subprocess so peak RSS is not shared.
+"model MB" is the peak RSS growth while loading and generating; int8 peaks
+while it reads the float32 checkpoint to quantize it. "steady MB" is the RSS
+growth once the model is loaded, has run a warm-up generation (so lazily
+mapped weights are paged in) and gc.collect() has run: what a serving
+process keeps. "weights MB" is the size of the loaded model's state_dict.
+
+    baseline  the previous path: transformers pipeline, device_map="auto", bfloat16
+    fp32      load_model(quantize="none")
+    int8      load_model(quantize="int8"): int8 Linear/Conv1D (dynamic) and embeddings
+
+Usage:
+    python benchmark_negotiator.py --model sshleifer/tiny-gpt2 --threads 4
+"""
+import argparse
+import gc
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+MODES = ["baseline", "fp32", "int8"]
+
+PROMPTS = [
+    "Anna: I can only travel May 3-10 (work schedule).\nLuis: I can only travel May 6-14 (school holidays).",
+    "Mia: I can only travel June 1-7 (family events).\nTom: I can only travel June 5-12 (budget constraints).\n"
+    "Sara: I can only travel June 4-9 (flight prices).",
+]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rss_mb() -> float:
+    # Current resident set, file-backed (memory-mapped checkpoint) pages included
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _weights_mb(model) -> float:
+    import torch
+
+    # Serialized state_dict: counts int8 packed weights, which parameters() does not list
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def run_mode(mode: str, model_path: str, new_tokens: int, repeats: int, threads: int) -> dict:
+    import torch
+    from negociation_model import PROMPT_PREFIX, PROMPT_SUFFIX, load_model
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    rss_before = _peak_rss_mb()
+    resident_before = _rss_mb()
+    started = time.perf_counter()
+    if mode == "baseline":
+        from transformers import pipeline
+        # device_map="auto" needs accelerate; without it the model stays on the CPU, same as "auto" there
+        device_map = "auto" if importlib.util.find_spec("accelerate") else None
+        negotiator = pipeline("text-generation", model=model_path, device_map=device_map, torch_dtype=torch.bfloat16)
+        tokenizer, model = negotiator.tokenizer, negotiator.model
+        device = model.device
+    else:
+        tokenizer, model, device = load_model(model_path, quantize="none" if mode == "fp32" else "int8")
+    load_seconds = time.perf_counter() - started
+
+    prompts = [f"{PROMPT_PREFIX}{p}{PROMPT_SUFFIX}" for p in PROMPTS]
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    generated = 0
+    elapsed = 0.0
+    with torch.inference_mode():
+        # Warm-up run, not timed
+        ids = tokenizer(prompts[0], return_tensors="pt").to(device)
+        model.generate(**ids, max_new_tokens=4, do_sample=False, pad_token_id=pad_id)
+        gc.collect()
+        steady_mb = _rss_mb() - resident_before
+        for _ in range(repeats):
+            for prompt in prompts:
+                ids = tokenizer(prompt, return_tensors="pt").to(device)
+                started = time.perf_counter()
+                output = model.generate(**ids, max_new_tokens=new_tokens, min_new_tokens=new_tokens,
+                                        do_sample=False, pad_token_id=pad_id)
+                elapsed += time.perf_counter() - started
+                generated += output.shape[1] - ids["input_ids"].shape[1]
+
+    return {
+        "mode": mode,
+        "device": str(device),
+        "load_seconds": round(load_seconds, 2),
+        "tokens": generated,
+        "tokens_per_second": round(generated / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "model_rss_mb": round(_peak_rss_mb() - rss_before, 1),
+        "steady_rss_mb": round(steady_mb, 1),
+        "weights_mb": round(_weights_mb(model), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("NEGOTIATOR_MODEL_PATH", "./traveltime_negotiator"))
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of " + ", ".join(MODES))
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0: torch default)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_mode(args.worker, args.model, args.new_tokens, args.repeats, args.threads)))
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for mode in args.modes.split(","):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", mode, "--model", args.model,
+                   "--new-tokens", str(args.new_tokens), "--repeats", str(args.repeats), "--threads", str(args.threads)]
+        completed = subprocess.run(command, cwd=here, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{mode}: failed\n{completed.stderr.strip()[-2000:]}", file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    header = f"{'mode':<10}{'device':<8}{'load s':>8}{'tok/s':>10}{'peak RSS MB':>14}{'model MB':>10}{'steady MB':>11}{'weights MB':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['mode']:<10}{r['device']:<8}{r['load_seconds']:>8}{r['tokens_per_second']:>10}"
+              f"{r['peak_rss_mb']:>14}{r['model_rss_mb']:>10}{r['steady_rss_mb']:>11}{r['weights_mb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
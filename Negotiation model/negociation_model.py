@@ -1,32 +1,346 @@
-from fastapi import FastAPI
-from transformers import pipeline
-from pydantic import BaseModel
-import torch
+"""Serving layer for the fine-tuned travel date negotiator.
+
+Concurrent /negotiate requests are queued and run in dynamic micro-batches:
+the batcher waits up to NEGOTIATOR_BATCH_WAIT_MS for up to
+NEGOTIATOR_MAX_BATCH_SIZE requests and decodes them together in one worker
+thread, so the event loop never blocks on the model. Requests beyond
+NEGOTIATOR_MAX_QUEUE are rejected with 503 instead of piling up.
+
+The "### Input:" template prefix shared by every prompt is run through the
+model once at startup; each batch starts from a copy of its KV cache.
+
+Runs on CPU as well as GPU. On CPU the model's Linear layers (GPT-2's Conv1D
+projections included) and embeddings are int8 quantized by default
+(NEGOTIATOR_QUANTIZE) and the model is loaded on the first request unless
+NEGOTIATOR_PRELOAD=1. To try it with a tiny checkpoint:
+
+    NEGOTIATOR_MODEL_PATH=sshleifer/tiny-gpt2 uvicorn negociation_model:app
+
+benchmark_negotiator.py compares tokens/sec and memory of the loading modes.
+"""
 import asyncio
+import copy
+import gc
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import torch
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers.pytorch_utils import Conv1D
+
+MODEL_PATH = os.getenv("NEGOTIATOR_MODEL_PATH", "./traveltime_negotiator")
+MAX_BATCH_SIZE = int(os.getenv("NEGOTIATOR_MAX_BATCH_SIZE", "8"))
+BATCH_WAIT_MS = float(os.getenv("NEGOTIATOR_BATCH_WAIT_MS", "10"))
+MAX_QUEUE = int(os.getenv("NEGOTIATOR_MAX_QUEUE", "64"))
+MAX_NEW_TOKENS = int(os.getenv("NEGOTIATOR_MAX_NEW_TOKENS", "200"))
+MAX_INPUT_TOKENS = int(os.getenv("NEGOTIATOR_MAX_INPUT_TOKENS", "1024"))
+TEMPERATURE = float(os.getenv("NEGOTIATOR_TEMPERATURE", "0.7"))
+# "int8" (dynamic quantization, CPU only), "none", or "auto": int8 on CPU, none on GPU
+QUANTIZE = os.getenv("NEGOTIATOR_QUANTIZE", "auto")
+# Intra-op CPU threads for torch; 0 keeps torch's default (one per core)
+NUM_THREADS = int(os.getenv("NEGOTIATOR_THREADS", "0"))
+# Load the model at startup instead of on the first request
+PRELOAD = os.getenv("NEGOTIATOR_PRELOAD", "0") == "1"
+
+# Same layout the model was fine-tuned on (model_fine_tune.py)
+PROMPT_PREFIX = "### Input:\n"
+PROMPT_SUFFIX = "\n### Output:\n"
+# The model starts a new example after its answer; stop there
+STOP_MARKER = "\n###"
+
 
-app = FastAPI()
 class Negotiate_request(BaseModel):
     messeges: list[dict]
+    stream: bool = False
+    max_new_tokens: Optional[int] = None
+
+
+class _Generation:
+    """One queued request: its prompt and the channel its text is streamed back on."""
+
+    def __init__(self, body_ids: List[int], max_new_tokens: int, loop: asyncio.AbstractEventLoop):
+        self.body_ids = body_ids
+        self.max_new_tokens = max_new_tokens
+        self.loop = loop
+        self.chunks: asyncio.Queue = asyncio.Queue()
+        self.text = ""
+
+    def emit(self, item):
+        """Called from the model thread: hands a text delta, an exception or None (done) to the request."""
+        self.loop.call_soon_threadsafe(self.chunks.put_nowait, item)
+
+    async def stream(self):
+        while True:
+            item = await self.chunks.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+def _stable_prefix(text: str) -> str:
+    """The part of a still-growing decode that later tokens cannot change.
+
+    Holds back a trailing partial UTF-8 character (decoded as U+FFFD) and a
+    trailing beginning of STOP_MARKER, so streamed deltas are never retracted.
+    """
+    text = text.rstrip("\ufffd")
+    for length in range(len(STOP_MARKER) - 1, 0, -1):
+        if text.endswith(STOP_MARKER[:length]):
+            return text[:-length]
+    return text
+
+
+def _conv1d_to_linear(model: torch.nn.Module) -> int:
+    """Replaces GPT-2 style Conv1D layers with equivalent nn.Linear ones, in place.
+
+    Conv1D is a Linear with a transposed (in, out) weight, but quantize_dynamic
+    only matches nn.Linear, so GPT-2's attention and MLP projections would stay
+    float32 and only lm_head would be quantized. The Linear's weight is a
+    transposed view of the Conv1D one, so no float32 copy is made; the bias is
+    copied because the quantized layer keeps it. Returns the number replaced.
+    """
+    replaced = 0
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                linear = torch.nn.Linear(child.nx, child.nf, device="meta")
+                linear.weight = torch.nn.Parameter(child.weight.t(), requires_grad=False)
+                linear.bias = torch.nn.Parameter(child.bias.clone(), requires_grad=False)
+                setattr(parent, name, linear)
+                replaced += 1
+    return replaced
+
+
+def _release_checkpoint(model: torch.nn.Module):
+    """Copies the float tensors quantization leaves (layer norms, biases) out of the checkpoint.
+
+    Loaded weights are views of the memory-mapped checkpoint file, which stays
+    mapped, and resident once read, while any tensor still points into it.
+    """
+    with torch.no_grad():
+        for tensor in itertools.chain(model.parameters(), model.buffers()):
+            tensor.data = tensor.data.clone()
+
+
+def load_model(model_path: str = MODEL_PATH, quantize: str = QUANTIZE, num_threads: int = NUM_THREADS):
+    """Loads the tokenizer and model for the available device.
+
+    GPUs get bfloat16 weights. CPUs get float32 weights, and with int8
+    quantization every nn.Linear is replaced by a dynamically quantized one
+    (int8 weights, activations quantized per batch), which shrinks the weights
+    about 4x and speeds up the matmuls that dominate decoding. GPT-2's Conv1D
+    projections are turned into nn.Linear first so they are quantized too, the
+    embeddings get int8 weights, and the float32 checkpoint is released once
+    quantized, so only the int8 model stays resident.
+
+    Returns:
+        (tokenizer, model, device)
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if quantize == "auto":
+        quantize = "int8" if device.type == "cpu" else "none"
+    if quantize not in ("int8", "none"):
+        raise ValueError(f"Unknown NEGOTIATOR_QUANTIZE mode: {quantize}")
+    if quantize == "int8" and device.type != "cpu":
+        raise ValueError("int8 dynamic quantization only runs on CPU")
+
+    dtype = torch.bfloat16 if device.type == "cuda" else torch.float32
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype, low_cpu_mem_usage=True)
+    if quantize == "int8":
+        _conv1d_to_linear(model)
+        # In place: the default deep copy would hold a second float32 model in memory
+        model = torch.ao.quantization.quantize_dynamic(model, {
+            torch.nn.Linear: torch.ao.quantization.default_dynamic_qconfig,
+            # Weight-only: GPT-2's token embedding is as large as all its Linear layers together
+            torch.nn.Embedding: torch.ao.quantization.float_qparams_weight_only_qconfig,
+        }, inplace=True)
+        _release_checkpoint(model)
+        gc.collect()
+    return tokenizer, model.to(device).eval(), device
+
+
+class NegotiatorServer:
+    def __init__(self, model_path: str = MODEL_PATH, quantize: str = QUANTIZE):
+        self.tokenizer, self.model, self.device = load_model(model_path, quantize)
+        self.pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        self.eos_id = self.tokenizer.eos_token_id
+
+        # Prefix caching: the template prefix is identical for every prompt
+        self.prefix_ids = self.tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(self.device)
+        with torch.inference_mode():
+            self.prefix_cache = self.model(self.prefix_ids, use_cache=True).past_key_values
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUE)
+        self._model_lock = threading.Lock()
+        self.stats = {"requests": 0, "rejected": 0, "batches": 0, "batched_requests": 0, "tokens": 0}
+
+    def encode(self, messages: List[dict]) -> List[int]:
+        convo = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        ids = self.tokenizer(convo + PROMPT_SUFFIX, add_special_tokens=False).input_ids
+        return ids[-MAX_INPUT_TOKENS:]
+
+    def submit(self, messages: List[dict], max_new_tokens: Optional[int] = None) -> _Generation:
+        """Queues a request; raises asyncio.QueueFull when MAX_QUEUE requests are already waiting."""
+        generation = _Generation(self.encode(messages), min(max_new_tokens or MAX_NEW_TOKENS, MAX_NEW_TOKENS),
+                                 asyncio.get_running_loop())
+        try:
+            self.queue.put_nowait(generation)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise
+        self.stats["requests"] += 1
+        return generation
+
+    async def run_batcher(self):
+        """Forms micro-batches from the queue and runs them one at a time in a worker thread."""
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + BATCH_WAIT_MS / 1000
+            while len(batch) < MAX_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            try:
+                await asyncio.to_thread(self._generate, batch)
+            except Exception as e:
+                for generation in batch:
+                    generation.emit(e)
+
+    @torch.inference_mode()
+    def _generate(self, batch: List[_Generation]):
+        """Decodes a batch token by token, streaming each request's text as it grows.
+
+        Prompts are laid out as [prefix][padding][body] so the shared prefix
+        cache lines up for every row; the padding is masked out and position
+        ids skip it.
+        """
+        with self._model_lock:
+            size = len(batch)
+            prefix_len = self.prefix_ids.shape[1]
+            body_len = max(len(g.body_ids) for g in batch)
+            input_ids = torch.full((size, body_len), self.pad_id, dtype=torch.long, device=self.device)
+            attention_mask = torch.zeros((size, prefix_len + body_len), dtype=torch.long, device=self.device)
+            attention_mask[:, :prefix_len] = 1
+            for row, generation in enumerate(batch):
+                n = len(generation.body_ids)
+                input_ids[row, body_len - n:] = torch.tensor(generation.body_ids, device=self.device)
+                attention_mask[row, prefix_len + body_len - n:] = 1
+            position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, prefix_len:]
+
+            cache = copy.deepcopy(self.prefix_cache)
+            cache.batch_repeat_interleave(size)
+
+            generated = [[] for _ in batch]
+            done = [False] * size
+            max_steps = max(g.max_new_tokens for g in batch)
+            for step in range(max_steps):
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                     position_ids=position_ids, past_key_values=cache, use_cache=True)
+                cache = outputs.past_key_values
+                logits = outputs.logits[:, -1, :].float()
+                if TEMPERATURE > 0:
+                    next_ids = torch.multinomial(torch.softmax(logits / TEMPERATURE, dim=-1), 1).squeeze(-1)
+                else:
+                    next_ids = logits.argmax(dim=-1)
+
+                for row, generation in enumerate(batch):
+                    if done[row]:
+                        continue
+                    token = int(next_ids[row])
+                    if token == self.eos_id:
+                        done[row] = True
+                    else:
+                        generated[row].append(token)
+                        self.stats["tokens"] += 1
+                        if len(generated[row]) >= generation.max_new_tokens:
+                            done[row] = True
+                    text = self.tokenizer.decode(generated[row], skip_special_tokens=True)
+                    stop = text.find(STOP_MARKER)
+                    if stop != -1:
+                        text, done[row] = text[:stop], True
+                    if not done[row]:
+                        text = _stable_prefix(text)
+                    if len(text) > len(generation.text):
+                        generation.emit(text[len(generation.text):])
+                        generation.text = text
+                if all(done):
+                    break
+
+                # Finished rows keep decoding padding until the whole batch is done
+                next_ids = torch.where(torch.tensor(done, device=self.device), self.pad_id, next_ids)
+                input_ids = next_ids.unsqueeze(-1)
+                attention_mask = torch.cat([attention_mask, torch.ones((size, 1), dtype=torch.long, device=self.device)], dim=-1)
+                position_ids = position_ids[:, -1:] + 1
+
+            for generation in batch:
+                generation.emit(None)
+
+
+server: Optional[NegotiatorServer] = None
+_batcher: Optional[asyncio.Task] = None
+_server_lock = asyncio.Lock()
+
+
+async def get_server() -> NegotiatorServer:
+    """Returns the server, loading the model (off the event loop) on first use."""
+    global server, _batcher
+    if server is None:
+        async with _server_lock:
+            if server is None:
+                loaded = await asyncio.to_thread(NegotiatorServer)
+                _batcher = asyncio.create_task(loaded.run_batcher())
+                server = loaded
+    return server
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PRELOAD:
+        await get_server()
+    yield
+    if _batcher is not None:
+        _batcher.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
-negotiator = pipeline("text-generation", model="./traveltime_negotiator",
-device_map = "auto", torch_dtype = torch.bfloat16)
 
 @app.post("/negotiate")
 async def negotiate(request: Negotiate_request):
-    convo = "/n".join([f"{msg['role']}]): {msg['content']}"
-    for msg in request.messeges])
-
-    prompt = f"""### Input:
-    {convo}
+    negotiator = await get_server()
+    try:
+        generation = negotiator.submit(request.messeges, request.max_new_tokens)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Negotiator is busy, try again shortly",
+                            headers={"Retry-After": "1"})
 
-    Comprimise options: """
+    if request.stream:
+        return StreamingResponse(generation.stream(), media_type="text/plain")
 
+    text = "".join([chunk async for chunk in generation.stream()])
+    return {"suggestions": text.strip()}
 
-    response = negotiator(
-        prompt,
-        maz_new_tokens=200,
-        temperature=0.7,
-        do_sample=True
-    )
 
-    return{"suggestions" : response[0]["generated_text"].split("### Output:")[1].strip()}
+@app.get("/stats")
+def stats():
+    if server is None:
+        return {"loaded": False}
+    return {"loaded": True, "device": server.device.type, **server.stats, "queued": server.queue.qsize()}
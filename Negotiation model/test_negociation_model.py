@@ -0,0 +1,133 @@
+import asyncio
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import negociation_model  # noqa: E402
+from negociation_model import STOP_MARKER, NegotiatorServer, _Generation, _stable_prefix  # noqa: E402
+
+CONVERSATIONS = [
+    [{"role": "user", "content": "Anna: I can only travel May 3-10."}],
+    [{"role": "user", "content": "Mia: I can only travel June 1-7 (family events)."},
+     {"role": "user", "content": "Tom: I can only travel June 5-12 (budget constraints)."}],
+]
+
+
+def build_tiny_gpt2(path: str):
+    """A randomly initialised GPT-2 of sshleifer/tiny-gpt2's depth, with a small byte-level BPE tokenizer.
+
+    Built offline so the test needs no download; n_embd is 32 instead of 2
+    so greedy decoding does not hinge on near-ties between logits.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    corpus = [f"{negociation_model.PROMPT_PREFIX}{m['role']}: {m['content']}{negociation_model.PROMPT_SUFFIX}"
+              for conversation in CONVERSATIONS for m in conversation]
+    bpe.train_from_iterator(corpus * 10, trainers.BpeTrainer(
+        vocab_size=300, special_tokens=["<|endoftext|>"], initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|endoftext|>",
+                                        bos_token="<|endoftext|>", unk_token="<|endoftext|>")
+    tokenizer.save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=256, n_embd=32, n_layer=2, n_head=2,
+                        initializer_range=0.5, bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    GPT2LMHeadModel(config).save_pretrained(path)
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    """NEGOTIATOR_TEST_MODEL (e.g. sshleifer/tiny-gpt2) if set, otherwise an offline tiny GPT-2."""
+    if os.getenv("NEGOTIATOR_TEST_MODEL"):
+        return os.environ["NEGOTIATOR_TEST_MODEL"]
+    path = str(tmp_path_factory.mktemp("tiny-gpt2"))
+    build_tiny_gpt2(path)
+    return path
+
+
+@pytest.fixture
+def greedy(monkeypatch):
+    monkeypatch.setattr(negociation_model, "TEMPERATURE", 0.0)
+
+
+def reference(server: NegotiatorServer, body_ids, max_new_tokens: int) -> str:
+    """What model.generate decodes greedily for the same prompt, cut at the stop marker like the server."""
+    ids = torch.tensor([server.prefix_ids[0].tolist() + body_ids], device=server.device)
+    with torch.inference_mode():
+        output = server.model.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=max_new_tokens,
+                                       do_sample=False, pad_token_id=server.pad_id)
+    text = server.tokenizer.decode(output[0, ids.shape[1]:], skip_special_tokens=True)
+    return text.split(STOP_MARKER)[0]
+
+
+def test_batched_decode_matches_generate(checkpoint, greedy):
+    server = NegotiatorServer(checkpoint, quantize="none")
+    loop = asyncio.new_event_loop()
+    try:
+        # Twice: the second batch must start from an untouched copy of the prefix cache
+        for _ in range(2):
+            batch = [_Generation(server.encode(conversation), 16, loop) for conversation in CONVERSATIONS]
+            assert len({len(generation.body_ids) for generation in batch}) > 1  # rows need padding
+            server._generate(batch)
+            for generation in batch:
+                assert generation.text == reference(server, generation.body_ids, 16)
+    finally:
+        loop.close()
+
+
+def test_concurrent_requests_share_a_batch_and_stream_their_text(checkpoint, greedy):
+    server = NegotiatorServer(checkpoint, quantize="none")
+
+    async def run():
+        batcher = asyncio.create_task(server.run_batcher())
+        try:
+            generations = [server.submit(conversation, 16) for conversation in CONVERSATIONS]
+            return generations, [[chunk async for chunk in g.stream()] for g in generations]
+        finally:
+            batcher.cancel()
+
+    generations, chunks = asyncio.run(run())
+
+    assert server.stats["batches"] == 1 and server.stats["batched_requests"] == 2
+    for generation, streamed in zip(generations, chunks):
+        assert "".join(streamed) == generation.text == reference(server, generation.body_ids, 16)
+
+
+def test_stable_prefix_holds_back_partial_characters_and_stop_markers():
+    assert _stable_prefix("Suggested Dates: May 4") == "Suggested Dates: May 4"
+    assert _stable_prefix("May 4\n#") == "May 4"
+    assert _stable_prefix("Caf�") == "Caf"
+
+
+def test_int8_quantizes_gpt2_projections_and_embeddings(checkpoint):
+    _, reference_model, _ = negociation_model.load_model(checkpoint, quantize="none")
+    tokenizer, model, _ = negociation_model.load_model(checkpoint, quantize="int8")
+
+    dynamic_linear = torch.ao.nn.quantized.dynamic.Linear
+    block = model.transformer.h[0]
+    for projection in (block.attn.c_attn, block.attn.c_proj, block.mlp.c_fc, block.mlp.c_proj):
+        assert isinstance(projection, dynamic_linear)
+    assert not any(isinstance(m, negociation_model.Conv1D) for m in model.modules())
+    assert isinstance(model.transformer.wte, torch.ao.nn.quantized.Embedding)
+
+    ids = tokenizer("### Input:\nAnna: May 3-10", return_tensors="pt")
+    with torch.inference_mode():
+        logits, expected = model(**ids).logits, reference_model(**ids).logits
+    assert logits.shape == expected.shape
+    assert ((logits - expected).norm() / expected.norm()).item() < 0.1
+
+
+def test_conv1d_to_linear_keeps_the_outputs(checkpoint):
+    _, model, _ = negociation_model.load_model(checkpoint, quantize="none")
+    ids = torch.tensor([[1, 2, 3, 4, 5]])
+    with torch.inference_mode():
+        expected = model(ids).logits
+        assert negociation_model._conv1d_to_linear(model) == 4 * model.config.n_layer
+        assert torch.allclose(model(ids).logits, expected, atol=1e-5)
@@ -0,0 +1,61 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+CITY_AIRPORTS_PATH = 'backend/data/city_airports.json'
+
+
+def normalize_city(name: str) -> str:
+    """Lowercases, strips accents and punctuation and collapses whitespace ("São  Paulo!" -> "sao paulo")."""
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    ascii_name = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]", " ", ascii_name.lower())).strip()
+
+
+class AirportIndex:
+    """Offline (city, country) -> airport lookup.
+
+    ``city_airports.json`` lists cities with the countries they may be given
+    in, their IATA codes and whether that list is ``complete`` (every
+    passenger airport of the city). Only exact, normalised matches of both
+    city and country are answered; anything else is left to the Skyscanner
+    autosuggest endpoint, so a similar-looking name never resolves to another
+    place.
+    """
+
+    def __init__(self, path: str = CITY_AIRPORTS_PATH):
+        self.entries: Dict[Tuple[str, str], Dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    for country in entry["countries"]:
+                        self.entries[(normalize_city(entry["city"]), normalize_city(country))] = entry
+
+    def lookup(self, city: str, country: str) -> Tuple[List[str], bool]:
+        """(IATA codes, complete) for an exact city and country match; ([], False) if unknown."""
+        entry = self.entries.get((normalize_city(city), normalize_city(country)))
+        if entry is None:
+            return [], False
+        return list(entry["iata"]), bool(entry["complete"])
+
+    def canonical_name(self, city: str, country: str) -> str:
+        """The indexed spelling of a city ("rio de janeiro" -> "Rio de Janeiro"), or the input unchanged."""
+        entry = self.entries.get((normalize_city(city), normalize_city(country)))
+        return entry["city"] if entry is not None else city
+
+
+_index: Optional[AirportIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_airport_index() -> AirportIndex:
+    """Returns the process-wide index, loading the data file on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AirportIndex()
+    return _index
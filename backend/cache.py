@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from cachetools import LRUCache
+
+# Per-provider defaults: (fresh seconds, extra seconds a stale value may be served while refreshing, max entries).
+# Override with CACHE_TTL_<NAME>, CACHE_STALE_<NAME> and CACHE_SIZE_<NAME>, e.g. CACHE_TTL_FLIGHT_QUOTES=600.
+PROVIDER_DEFAULTS = {
+    "city_images": (7 * 24 * 3600, 7 * 24 * 3600, 2000),
+    "hotels": (24 * 3600, 24 * 3600, 2000),
+    "hotel_photos": (7 * 24 * 3600, 7 * 24 * 3600, 10000),
+    "hotel_details": (24 * 3600, 24 * 3600, 2000),
+    "llm_responses": (3600, 0, 500),
+    # Quotes expire on disk by quote_ttl (quote_cache.py); in memory only concurrent fetches are shared
+    "flight_quotes": (0, 0, 20000),
+    "airport_codes": (7 * 24 * 3600, 24 * 3600, 5000),
+}
+_FALLBACK_DEFAULTS = (3600, 3600, 1000)
+
+
+class ProviderCache:
+    """Size-bounded LRU cache of one provider's responses with a freshness TTL.
+
+    ``get_or_fetch`` returns a fresh value from memory; a value past its TTL
+    but within ``stale_ttl`` is returned immediately while one background
+    refresh runs (stale-while-revalidate); anything older is fetched.
+    Concurrent misses for the same key share a single upstream call; with a
+    ttl and stale_ttl of 0 nothing is kept and only that sharing remains.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0, maxsize: int = 1000,
+                 cache_none: bool = False):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cache_none = cache_none
+        self._entries: LRUCache = LRUCache(maxsize=maxsize)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refresh_errors": 0}
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            self.stats["coalesced"] += 1
+            return task
+
+        async def run():
+            try:
+                value = await fetch()
+                if (value is not None or self.cache_none) and self.ttl + self.stale_ttl > 0:
+                    self._entries[key] = (value, time.monotonic())
+                return value
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.ensure_future(run())
+        self._inflight[key] = task
+        return task
+
+    def _refresh_in_background(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        task = self._start_fetch(key, fetch)
+
+        def log_failure(done: asyncio.Task):
+            if not done.cancelled() and done.exception() is not None:
+                self.stats["refresh_errors"] += 1
+                print(f"Cache refresh failed for {self.name} {key!r}: {done.exception()}")
+
+        task.add_done_callback(log_failure)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self.stats["hits"] += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._refresh_in_background(key, fetch)
+                return value
+        self.stats["misses"] += 1
+        # shield: a cancelled caller must not cancel the fetch other callers are waiting on
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drops one key, or every entry when key is None."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def info(self) -> Dict:
+        return {"size": len(self._entries), "maxsize": self._entries.maxsize, "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl, **self.stats}
+
+
+_caches: Dict[str, ProviderCache] = {}
+
+
+def get_cache(name: str) -> ProviderCache:
+    """Returns the process-wide cache of a provider, creating it from PROVIDER_DEFAULTS and env overrides."""
+    cache = _caches.get(name)
+    if cache is None:
+        ttl, stale_ttl, maxsize = PROVIDER_DEFAULTS.get(name, _FALLBACK_DEFAULTS)
+        env_name = name.upper()
+        cache = ProviderCache(
+            name,
+            ttl=float(os.getenv(f"CACHE_TTL_{env_name}", ttl)),
+            stale_ttl=float(os.getenv(f"CACHE_STALE_{env_name}", stale_ttl)),
+            maxsize=int(os.getenv(f"CACHE_SIZE_{env_name}", maxsize)),
+        )
+        _caches[name] = cache
+    return cache
+
+
+def cache_stats() -> Dict[str, Dict]:
+    return {name: cache.info() for name, cache in _caches.items()}
+
+
+def cached(provider: str, key: Optional[Callable[..., Hashable]] = None):
+    """Caches an async function's results in the provider's ProviderCache.
+
+    ``key`` builds the cache key from the call arguments; by default the
+    arguments themselves are used. None results are not cached, so failures
+    that return None are retried on the next call. The undecorated function
+    stays available as ``func.uncached``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return await get_cache(provider).get_or_fetch(cache_key, lambda: func(*args, **kwargs))
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
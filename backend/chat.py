@@ -1,14 +1,8 @@
-from google import genai
 from google.genai import types
-from dotenv import load_dotenv
 from .models import *
-import os
+from .gemini import generate_content
 import asyncio
-
-load_dotenv()  # take environment variables
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-
-client = genai.Client(api_key=gemini_api_key)
+import json
 
 prompt_instructions = """
 You are given a chat with different users discussing various topics related to a trip. 
@@ -19,8 +13,15 @@ The tags to score are: food, hiking, english_friendly, nightlife, culture, safet
 3.Include an optional "favoured_city" field: a list of cities that the user explicitly states they want to visit. If no cities are favoured, return an empty list for "favoured_city".
 """
 
+update_instructions = prompt_instructions + """
+You are also given the preferences already extracted from the earlier part of the chat, as JSON.
+Only the new messages are included. Return the updated preferences for every user: keep a user's
+previous scores, veto and favoured_city unless the new messages change them, and add new users.
+"""
+
 async def chat_with_gemini(chat_data: str) -> str:
-    response = client.models.generate_content(
+    response = await generate_content(
+        cache=True,
         model="gemini-2.0-flash", 
         contents=[prompt_instructions, chat_data],
         config= types.GenerateContentConfig(
@@ -35,6 +36,26 @@ async def chat_with_gemini(chat_data: str) -> str:
     llm_json: list[TravelPreference] = response.parsed
     return llm_json
 
+async def update_preferences_with_gemini(previous: List[TravelPreference], new_chat_data: str) -> List[TravelPreference]:
+    """Updates previously extracted preferences with only the messages sent since."""
+    previous_json = json.dumps([pref.model_dump() for pref in previous])
+    response = await generate_content(
+        cache=True,
+        model="gemini-2.0-flash",
+        contents=[f"Previous preferences:\n{previous_json}", f"New messages:{new_chat_data}"],
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=list[TravelPreference],
+            system_instruction=update_instructions,
+            temperature=0.3
+        )
+    )
+    print(response.text)
+    updated: List[TravelPreference] = response.parsed or []
+    # A user the model left out keeps their previous preferences
+    returned = {pref.user for pref in updated}
+    return updated + [pref for pref in previous if pref.user not in returned]
+
 if __name__ == "__main__":
     chat_example = """
     User1: I love hiking and exploring nature.
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Set
+
+from .jobs import get_job_queue
+from .message_store import DEFAULT_CHAT
+
+QUEUE_SIZE = int(os.getenv("CHAT_HUB_QUEUE_SIZE", "100"))
+# Seconds between a socket's checks of the shared stores for messages and statuses written by other processes
+SHARED_POLL_INTERVAL = float(os.getenv("CHAT_HUB_SHARED_POLL_INTERVAL", "1"))
+
+
+class Subscription:
+    """One listener on a chat. Events are read with ``await subscription.get()``."""
+
+    def __init__(self, chat_id: str, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.chat_id = chat_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+    def _offer(self, event: Dict):
+        """Queues an event without blocking. Runs on the subscriber's event loop."""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The subscriber is not keeping up. Rather than buffer without bound or block
+            # the publisher, drop what is queued and tell it to re-fetch from its cursor.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+
+class ChatHub:
+    """In-process fan-out of chat events to every subscriber of a chat.
+
+    ``publish`` never blocks and may be called from any thread. Each subscriber
+    has a bounded queue; a subscriber that falls behind gets a single
+    ``{"type": "resync"}`` event instead of the backlog. Events only reach
+    subscribers connected to the same process; sockets also poll the shared
+    message store and job database (SHARED_POLL_INTERVAL) for what other
+    web or worker processes wrote.
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, chat_id: str = DEFAULT_CHAT) -> Subscription:
+        """Registers a subscriber on the running event loop."""
+        subscription = Subscription(chat_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(chat_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.chat_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.chat_id]
+
+    def subscriber_count(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            return len(self._subscribers.get(chat_id, ()))
+
+    def publish(self, event: Dict, chat_id: str = DEFAULT_CHAT):
+        """Delivers an event to every subscriber of a chat."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(chat_id, ()))
+        try:
+            current_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            current_loop = None
+        for subscription in subscribers:
+            if subscription.loop is current_loop:
+                subscription._offer(event)
+            elif not subscription.loop.is_closed():
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+
+
+chat_hub = ChatHub()
+
+
+def publish_message(message: Dict, chat_id: str = DEFAULT_CHAT):
+    """Pushes a newly stored chat message to the chat's subscribers."""
+    chat_hub.publish({"type": "message", "message": message}, chat_id)
+
+
+def publish_status(pipeline: str, status: str, chat_id: str = DEFAULT_CHAT, **details):
+    """Pushes a pipeline status change (e.g. recommendations processing -> ready).
+
+    The event is also recorded in the job database with a sequence number
+    ("seq"), from which sockets on other processes pick it up.
+    """
+    event = {"type": "status", "pipeline": pipeline, "status": status, **details}
+    event["seq"] = get_job_queue().record_status(chat_id, event)
+    chat_hub.publish(event, chat_id)
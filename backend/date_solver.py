@@ -0,0 +1,94 @@
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+
+from .models import TripData
+
+
+def _window(trip: TripData):
+    """(start ordinal, end ordinal) of a trip's inclusive availability window."""
+    return date.fromisoformat(str(trip.start_date)[:10]).toordinal(), date.fromisoformat(str(trip.end_date)[:10]).toordinal()
+
+
+def solve_date_overlap(trips: List[TripData], alternatives: int = 3) -> Dict:
+    """Earliest date range that the most travellers can attend.
+
+    A sweep line over the windows' start and end events splits the calendar
+    into ranges where the set of available travellers is constant; the ranges
+    are ranked by attendance, then by earliest start. Runs in O(n log n), so
+    thousands of travellers take milliseconds.
+
+    Args:
+        trips: the room's TripData, e.g. from load_trip_data_from_csv.
+        alternatives: number of runner-up ranges to return.
+
+    Returns:
+        dict with "best" (or None when nobody has a valid window),
+        "alternatives", "participants" and "invalid" (user_ids whose dates
+        could not be parsed or end before they start). Each range is
+        {"start", "end", "attendees", "excluded"} with ISO dates and user_ids.
+    """
+    users, starts, ends, invalid = [], [], [], []
+    for trip in trips:
+        try:
+            start, end = _window(trip)
+        except ValueError:
+            invalid.append(trip.user_id)
+            continue
+        if end < start:
+            invalid.append(trip.user_id)
+            continue
+        users.append(trip.user_id)
+        starts.append(start)
+        ends.append(end)
+
+    result = {"best": None, "alternatives": [], "participants": len(users), "invalid": invalid}
+    if not users:
+        return result
+
+    starts = np.array(starts)
+    ends = np.array(ends) + 1  # exclusive end: a window ending on day d is left on d + 1
+    # Every start or end event opens a new range; the count of windows open over
+    # [boundaries[i], boundaries[i + 1]) is #starts <= b minus #ends <= b
+    boundaries = np.unique(np.concatenate([starts, ends]))
+    counts = (np.searchsorted(np.sort(starts), boundaries[:-1], side="right")
+              - np.searchsorted(np.sort(ends), boundaries[:-1], side="right"))
+
+    # Most attendees first, earliest first among equals
+    order = np.lexsort((boundaries[:-1], -counts))
+    ranked = [i for i in order if counts[i] > 0][:alternatives + 1]
+
+    users = np.array(users, dtype=object)
+    ranges = []
+    for i in ranked:
+        range_start, range_end = boundaries[i], boundaries[i + 1] - 1
+        available = (starts <= range_start) & (ends > range_end)
+        ranges.append({
+            "start": date.fromordinal(int(range_start)).isoformat(),
+            "end": date.fromordinal(int(range_end)).isoformat(),
+            "attendees": users[available].tolist(),
+            "excluded": users[~available].tolist(),
+        })
+    result["best"], result["alternatives"] = ranges[0], ranges[1:]
+    return result
+
+
+def format_date_suggestion(result: Dict) -> str:
+    """Chat message for a solve_date_overlap result, in the negotiation assistant's format."""
+    best = result["best"]
+    if best is None:
+        return "Suggested Dates: none\nReason: Nobody has shared valid travel dates yet."
+    dates = best["start"] if best["start"] == best["end"] else f"{best['start']} to {best['end']}"
+    if best["excluded"]:
+        reason = (f"{len(best['attendees'])} of {result['participants']} travellers are available; "
+                  f"{', '.join(best['excluded'])} cannot make it.")
+    else:
+        reason = f"All {result['participants']} travellers are available."
+    lines = [f"Suggested Dates: {dates}", f"Reason: {reason}"]
+    for alternative in result["alternatives"]:
+        alt_dates = alternative["start"] if alternative["start"] == alternative["end"] else f"{alternative['start']} to {alternative['end']}"
+        lines.append(f"Alternative: {alt_dates} ({len(alternative['attendees'])} of {result['participants']} available)")
+    if result["invalid"]:
+        lines.append(f"Could not read the dates of: {', '.join(result['invalid'])}")
+    return "\n".join(lines)
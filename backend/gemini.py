@@ -0,0 +1,66 @@
+from google import genai
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+from .cache import get_cache
+from .llm_cache import get_llm_cache, response_cache_key
+import asyncio
+import os
+
+load_dotenv()  # take environment variables
+gemini_api_key = os.getenv("GEMINI_API_KEY")
+
+client = genai.Client(api_key=gemini_api_key)
+
+# Seconds a single Gemini call may take before it is abandoned
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+# Maximum number of Gemini calls in flight per process
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+
+async def _limited(call, timeout: float):
+    """Runs a Gemini SDK coroutine factory under the concurrency limit and a timeout."""
+    async with _semaphore:
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Gemini call did not finish within {timeout} seconds")
+
+
+class CachedResponse:
+    """The parts of a GenerateContentResponse callers use (``text`` and ``parsed``), rebuilt from the cache."""
+
+    def __init__(self, text: str, config=None):
+        self.text = text
+        self.parsed = None
+        schema = getattr(config, "response_schema", None)
+        if schema is not None and getattr(config, "response_mime_type", None) == "application/json":
+            self.parsed = TypeAdapter(schema).validate_json(text)
+
+
+async def generate_content(timeout: float = GEMINI_TIMEOUT, cache: bool = False, **kwargs):
+    """Non-blocking ``client.models.generate_content``; takes the same keyword arguments.
+
+    With ``cache=True`` the response is reused for identical arguments (model,
+    contents and config, including instructions, temperature and schema): from
+    memory, then from the on-disk LLM cache, and concurrent identical calls share
+    one request. Cached calls return a CachedResponse.
+    """
+    if not cache:
+        return await _limited(lambda: client.aio.models.generate_content(**kwargs), timeout)
+
+    key = response_cache_key(**kwargs)
+
+    async def fetch():
+        store = get_llm_cache()
+        text = await asyncio.to_thread(store.get, key)
+        if text is None:
+            response = await _limited(lambda: client.aio.models.generate_content(**kwargs), timeout)
+            text = response.text
+            if text:
+                await asyncio.to_thread(store.put, key, text, kwargs.get("model"))
+        return text
+
+    text = await get_cache("llm_responses").get_or_fetch(key, fetch)
+    return CachedResponse(text, kwargs.get("config"))
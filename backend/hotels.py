@@ -1,23 +1,28 @@
+import asyncio
 import os
 import sys
-import requests
+from . import http_client
+from .cache import cached
 
 API_KEY = os.getenv("FOURSQUARE_API_KEY")
 if not API_KEY:
-    print("Error: set FOURSQUARE_API_KEY in your environment")
-    sys.exit(1)
+    raise RuntimeError("Set FOURSQUARE_API_KEY in your environment")
+
+# Maximum cities whose hotels are fetched at once by prefetch_hotels
+HOTEL_PREFETCH_CONCURRENCY = int(os.getenv("HOTEL_PREFETCH_CONCURRENCY", "4"))
 
 HEADERS = {
     "Accept": "application/json",
     "Authorization": API_KEY
 }
 
-def fetch_hotels(city: str, limit: int = 5):
+@cached("hotels", key=lambda city, limit=5: (city.strip().lower(), limit))
+async def fetch_hotels(city: str, limit: int = 5):
     """
     Search for hotels in the given city.
     Returns a list of place dicts from Foursquare.
     """
-    resp = requests.get(
+    resp = await http_client.get(
         "https://api.foursquare.com/v3/places/search",
         headers=HEADERS,
         params={
@@ -29,11 +34,12 @@ def fetch_hotels(city: str, limit: int = 5):
     resp.raise_for_status()
     return resp.json().get("results", [])
 
-def fetch_photo_url(fsq_id: str):
+@cached("hotel_photos")
+async def fetch_photo_url(fsq_id: str):
     """
     Fetch the first photo for a given place ID.
     """
-    resp = requests.get(
+    resp = await http_client.get(
         f"https://api.foursquare.com/v3/places/{fsq_id}/photos",
         headers=HEADERS,
         params={"limit": 1}
@@ -46,22 +52,76 @@ def fetch_photo_url(fsq_id: str):
         return f"{p['prefix']}original{p['suffix']}"
     return None
 
-def display_hotels(city: str):
-    hotels = fetch_hotels(city)
+async def _safe_photo_url(fsq_id: str):
+    try:
+        return await fetch_photo_url(fsq_id)
+    except Exception as e:
+        print(f"Error fetching photo for {fsq_id}: {e}")
+        return None
+
+@cached("hotel_details", key=lambda city, limit=5: (city.strip().lower(), limit))
+async def fetch_hotel_details(city: str, limit: int = 5):
+    """
+    Hotels in the given city with their photo URL.
+    Photos for all hotels are fetched concurrently; a failed photo lookup leaves photo_url None.
+    Returns a list of dicts with fsq_id, name, location and photo_url.
+    """
+    hotels = await fetch_hotels(city, limit)
+    photos = await asyncio.gather(*(_safe_photo_url(h["fsq_id"]) for h in hotels))
+    return [_hotel_details(h, photo) for h, photo in zip(hotels, photos)]
+
+async def fetch_first_hotel(city: str):
+    """
+    The first hotel in the given city with its photo URL, or None if there is none.
+    Only that hotel's photo is fetched; both lookups hit the caches prefetch_hotels warms.
+    """
+    hotels = await fetch_hotels(city)
+    if not hotels:
+        return None
+    return _hotel_details(hotels[0], await _safe_photo_url(hotels[0]["fsq_id"]))
+
+def _hotel_details(hotel, photo_url):
+    return {
+        "fsq_id": hotel["fsq_id"],
+        "name": hotel.get("name", "Unknown"),
+        "location": hotel.get("location", {}).get("formatted_address", ""),
+        "photo_url": photo_url,
+    }
+
+async def prefetch_hotels(cities, limit: int = 5):
+    """
+    Warm the hotel caches for several cities at once (e.g. every recommended city).
+    At most HOTEL_PREFETCH_CONCURRENCY cities are fetched in parallel; failures are logged, not raised.
+    Returns the number of cities fetched successfully.
+    """
+    semaphore = asyncio.Semaphore(HOTEL_PREFETCH_CONCURRENCY)
+
+    async def prefetch(city):
+        async with semaphore:
+            try:
+                await fetch_hotel_details(city, limit)
+                return True
+            except Exception as e:
+                print(f"Error prefetching hotels for {city}: {e}")
+                return False
+
+    results = await asyncio.gather(*(prefetch(city) for city in dict.fromkeys(cities)))
+    return sum(results)
+
+async def display_hotels(city: str):
+    hotels = await fetch_hotel_details(city)
     if not hotels:
         print(f"No hotels found for '{city}'.")
         return
 
     for i, h in enumerate(hotels, 1):
-        name = h.get("name", "–")
-        loc = ", ".join(h.get("location", {}).get("formatted_address", []))
-        photo = fetch_photo_url(h["fsq_id"]) or "No image"
-        print(f"{i}. {name}")
-        print(f"   Location: {loc}")
+        print(f"{i}. {h['name']}")
+        print(f"   Location: {h['location']}")
+        print(f"   Photo: {h['photo_url'] or 'No image'}")
 
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
-        print("Usage: python hotel_info_fsq.py <CityName>")
+        print("Usage: python -m backend.hotels <CityName>")
         sys.exit(1)
-    display_hotels(sys.argv[1])
+    asyncio.run(display_hotels(sys.argv[1]))
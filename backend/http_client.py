@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+import random
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+# Seconds to wait for a provider before giving up on one attempt
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+# Connection pool size shared by all providers, and the cap per host
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "20"))
+# Attempts after the first one for transport errors, 429 and 5xx responses
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared keep-alive client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+            transport=_transport,
+        )
+    return _client
+
+
+async def close_http_client():
+    """Closes the shared client (called on app shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """Routes every outbound request through ``transport`` (e.g. a StubTransport in tests).
+
+    Pass None to go back to the network.
+    """
+    global _client, _transport
+    _transport = transport
+    _client = None
+    _host_limits.clear()
+
+
+def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+async def request(method: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+    """Sends a request through the shared client.
+
+    Transport errors, 429 and 5xx responses are retried with jittered
+    exponential backoff. Other responses are returned as-is; call
+    ``raise_for_status()`` where an error status should raise.
+    """
+    if kwargs.get("headers"):
+        # Like requests, skip headers whose value is None (e.g. an unset API key)
+        kwargs["headers"] = {k: v for k, v in kwargs["headers"].items() if v is not None}
+    host = urlsplit(url).netloc
+    limit = _host_limits.setdefault(host, asyncio.Semaphore(HTTP_MAX_PER_HOST))
+    client = get_http_client()
+    for attempt in range(retries + 1):
+        response = None
+        try:
+            async with limit:
+                response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(_backoff(attempt, response))
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """In-process transport that answers from registered routes instead of the network.
+
+    Example:
+        stub = StubTransport()
+        stub.add("GET", "https://api.pexels.com/v1/search", json={"photos": []})
+        set_transport(stub)
+
+    Routes match on method and URL prefix (query string ignored); the most
+    recently added match wins. ``handler`` may be given instead of a fixed
+    response to compute one from the ``httpx.Request``. Every request is
+    recorded in ``stub.requests``. Unmatched requests get a 404.
+    """
+
+    def __init__(self):
+        self.routes: List[Tuple[str, str, Callable[[httpx.Request], httpx.Response]]] = []
+        self.requests: List[httpx.Request] = []
+
+    def add(self, method: str, url_prefix: str, status_code: int = 200, json=None,
+            handler: Optional[Callable[[httpx.Request], httpx.Response]] = None):
+        if handler is None:
+            body = json
+
+            def handler(request: httpx.Request) -> httpx.Response:
+                return httpx.Response(status_code, json=body)
+
+        self.routes.append((method.upper(), url_prefix, handler))
+
+    def calls(self, method: str, url_prefix: str) -> List[httpx.Request]:
+        """Recorded requests matching a method and URL prefix."""
+        return [r for r in self.requests
+                if r.method == method.upper() and str(r.url).startswith(url_prefix)]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        url = str(request.url.copy_with(query=None))
+        for method, prefix, handler in reversed(self.routes):
+            if request.method == method and url.startswith(prefix):
+                response = handler(request)
+                if asyncio.iscoroutine(response):
+                    response = await response
+                return response
+        return httpx.Response(404, json={"error": f"No stub for {request.method} {url}"})
+
+
+def request_json(request: httpx.Request):
+    """Decodes the JSON body of a recorded request (handy inside stub handlers)."""
+    return json.loads(request.content or b"null")
@@ -1,8 +1,27 @@
-import requests
+import httpx
 import os
 from dotenv import dotenv_values
+from . import http_client
+from .cache import cached
 
-def get_city_image_link(city_name):
+@cached("city_images", key=lambda city_name: city_name.strip().lower())
+async def fetch_city_image_link(city_name):
+    """Fetches the first Pexels skyline photo URL for a city, or None if there is none. Raises on HTTP errors."""
+    url = "https://api.pexels.com/v1/search"
+    headers = {
+        "Authorization": os.getenv("PEXELS_API_KEY")
+    }
+    # Make the request with the headers
+    response = await http_client.get(
+        url, headers=headers, params={"query": f"{city_name} city skyline", "per_page": 1}
+    )
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('photos'):
+        return None
+    return data['photos'][0]['src']['large']
+
+async def get_city_image_link(city_name):
     """
     Fetches a random photo link of the specified city using Pexels API.
     No API key required.    Args:
@@ -10,27 +29,19 @@ def get_city_image_link(city_name):
         str: Direct URL to a city image or error message
     """
     try:
-        # Pexels API endpoint (no key needed)
-        url = f"https://api.pexels.com/v1/search?query={city_name}+city+skyline&per_page=1"        # Make the request with default headers
-        headers = {
-            "Authorization": os.getenv("PEXELS_API_KEY")
-        }
-        # Make the request with the headers
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        if not data.get('photos'):
+        image_link = await fetch_city_image_link(city_name)
+        if not image_link:
             return f"No images found for {city_name}"
-        print(data['photos'][0]['src']['large'])
-        return(data['photos'][0]['src']['large'])
+        return image_link
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return f"Error fetching image: {str(e)}"# Example usage
 
 if __name__ == "__main__":
+    import asyncio
     city = input().strip()
     if not city:
         print("Please enter a valid city name")
     else:
-        image_link = get_city_image_link(city)
+        image_link = asyncio.run(get_city_image_link(city))
         print("\nImage Link:", image_link)
\ No newline at end of file
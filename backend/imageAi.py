@@ -1,13 +1,13 @@
-from google import genai
 from google.genai import types
-from dotenv import load_dotenv
-import os
+from .gemini import generate_content
+from .image_hash import dhash, get_geolocation_cache
+from .image_preprocess import prepare_image, get_city_locator
 import base64
 import asyncio
+import os
 
-load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=gemini_api_key)
+# Largest image accepted for geolocation, in bytes
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
 
 
 # Instruct Gemini to identify the place in the image
@@ -17,13 +17,41 @@ Analyze the image and return the most likely city, based solely on visual cues.
 Do not return anything else, simply these two things
 """
 
-async def image_to_location():
-    my_file = client.files.upload(file="image.jpg")
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds IMAGE_MAX_BYTES."""
+
+async def image_bytes_to_location(image_data: bytes, mime_type: str = "image/jpeg"):
+    """Geolocate an in-memory image, sending its bytes inline to Gemini (no file upload).
+
+    The image is downsized and stripped of EXIF first. A photo with EXIF GPS
+    near a known city, or one matching an already geolocated photo, is
+    answered without calling Gemini.
+    """
+    if len(image_data) > IMAGE_MAX_BYTES:
+        raise ImageTooLargeError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+
+    # Decoding and resizing are CPU-bound, keep them off the event loop
+    image_data, mime_type, gps = await asyncio.to_thread(prepare_image, image_data, mime_type)
+    if gps is not None:
+        location = get_city_locator().nearest(*gps)
+        if location is not None:
+            return location
+
+    # Same or near-identical photo already geolocated: answer without calling Gemini
+    geolocation_cache = get_geolocation_cache()
+    image_hash = await asyncio.to_thread(dhash, image_data)
+    location = geolocation_cache.lookup(image_data, image_hash)
+    if location is not None:
+        return location
+
+    contents = [prompt_instructions, types.Part.from_bytes(data=image_data, mime_type=mime_type)]
+    if gps is not None:
+        contents.append(f"The photo's GPS position is latitude {gps[0]:.5f}, longitude {gps[1]:.5f}.")
 
     # Call a vision-capable Gemini model
-    response = client.models.generate_content(
+    response = await generate_content(
         model="gemini-2.0-flash",
-        contents=[prompt_instructions, my_file],
+        contents=contents,
         config=types.GenerateContentConfig(
             response_mime_type="text/plain",
             temperature=0.0
@@ -32,17 +60,22 @@ async def image_to_location():
     print("Response from Gemini:")
     print(response.text)
     # Strip and return the plain-text location
-    return response.text.strip()
-
-def save_image_to_file(base64_str: str):
-    # Decode the base64 string and save the image to a file
-    try:
-        image_data = base64.b64decode(base64_str.split(",")[1])  # Handle potential prefix like "data:image/jpeg;base64,"
-        with open("image.jpg", "wb") as f:
-            f.write(image_data)
-    except Exception as e:
-        return f"Error saving image: {e}"
-        
-        
-if __name__ == "__main__":
-    asyncio.run(image_to_location())
+    location = response.text.strip()
+    if location:
+        geolocation_cache.remember(image_data, location, image_hash)
+    return location
+
+def decode_base64_image(base64_str: str):
+    """Decode a base64 image, with or without a "data:image/...;base64," prefix.
+
+    Returns (image bytes, mime type).
+    """
+    mime_type = "image/jpeg"
+    if "," in base64_str:
+        header, base64_str = base64_str.split(",", 1)
+        if header.startswith("data:"):
+            mime_type = header[5:].split(";")[0] or mime_type
+    # Reject oversized payloads before decoding them (4 base64 chars per 3 bytes)
+    if len(base64_str) * 3 // 4 > IMAGE_MAX_BYTES + 2:
+        raise ImageTooLargeError(f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+    return base64.b64decode(base64_str), mime_type
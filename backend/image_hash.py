@@ -0,0 +1,115 @@
+import hashlib
+import io
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+# Two images whose 64-bit dHashes differ in at most this many bits are treated as the same photo
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "6"))
+# Hashes with fewer set (or unset) bits than this come from flat, low-detail images such as a
+# clear sky or a dark night shot, which all hash alike; those images are matched exactly instead
+IMAGE_HASH_MIN_BITS = int(os.getenv("IMAGE_HASH_MIN_BITS", "8"))
+# Maximum number of remembered images; the oldest is forgotten first
+IMAGE_HASH_CACHE_SIZE = int(os.getenv("IMAGE_HASH_CACHE_SIZE", "10000"))
+
+
+def dhash(image_data: bytes, size: int = 8) -> Optional[int]:
+    """64-bit difference hash of an image, or None if the bytes are not a readable image.
+
+    The image is shrunk to (size + 1) x size greyscale pixels and each bit
+    records whether a pixel is brighter than its right neighbour, so
+    re-encoding, resizing or recompressing a photo barely changes the hash.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            image.draft("L", (size * 8, size * 8))  # let JPEG decode at reduced scale
+            pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS), dtype=np.int16)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class GeolocationCache:
+    """Locations already detected for images, looked up by perceptual hash.
+
+    Near-duplicates (forwarded or recompressed copies of the same photo) are
+    matched by Hamming distance between dHashes, vectorised over every
+    remembered hash. Bytes that cannot be decoded as an image, and flat images
+    whose hash carries too little detail to tell them apart, fall back to an
+    exact SHA-256 match.
+    """
+
+    def __init__(self, max_distance: int = IMAGE_HASH_MAX_DISTANCE, maxsize: int = IMAGE_HASH_CACHE_SIZE,
+                 min_bits: int = IMAGE_HASH_MIN_BITS):
+        self.max_distance = max_distance
+        self.maxsize = maxsize
+        self.min_bits = min_bits
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(maxsize, dtype=np.uint64)
+        self._locations = [None] * maxsize
+        self._count = 0
+        self._next = 0  # ring buffer slot overwritten by the next insert
+        self._exact: Dict[str, str] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _distinctive(self, image_hash: Optional[int]) -> bool:
+        """True if the hash has enough set and unset bits to be matched by distance."""
+        return image_hash is not None and self.min_bits <= image_hash.bit_count() <= 64 - self.min_bits
+
+    def lookup(self, image_data: bytes, image_hash: Optional[int] = None) -> Optional[str]:
+        """The location of the closest remembered image within max_distance, or None."""
+        if image_hash is None:
+            image_hash = dhash(image_data)
+        with self._lock:
+            if not self._distinctive(image_hash):
+                location = self._exact.get(hashlib.sha256(image_data).hexdigest())
+            else:
+                location = None
+                if self._count:
+                    distances = np.bitwise_count(self._hashes[:self._count] ^ np.uint64(image_hash))
+                    best = int(np.argmin(distances))
+                    if distances[best] <= self.max_distance:
+                        location = self._locations[best]
+            self.stats["hits" if location is not None else "misses"] += 1
+        return location
+
+    def remember(self, image_data: bytes, location: str, image_hash: Optional[int] = None):
+        if image_hash is None:
+            image_hash = dhash(image_data)
+        with self._lock:
+            if not self._distinctive(image_hash):
+                if len(self._exact) >= self.maxsize:
+                    self._exact.pop(next(iter(self._exact)))
+                self._exact[hashlib.sha256(image_data).hexdigest()] = location
+                return
+            self._hashes[self._next] = image_hash
+            self._locations[self._next] = location
+            self._next = (self._next + 1) % self.maxsize
+            self._count = min(self._count + 1, self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._count = self._next = 0
+            self._exact.clear()
+
+    def info(self) -> Dict:
+        return {"size": self._count + len(self._exact), "maxsize": self.maxsize,
+                "max_distance": self.max_distance, "min_bits": self.min_bits, **self.stats}
+
+
+_geolocation_cache: Optional[GeolocationCache] = None
+_geolocation_cache_lock = threading.Lock()
+
+
+def get_geolocation_cache() -> GeolocationCache:
+    """Returns the process-wide geolocation cache."""
+    global _geolocation_cache
+    if _geolocation_cache is None:
+        with _geolocation_cache_lock:
+            if _geolocation_cache is None:
+                _geolocation_cache = GeolocationCache()
+    return _geolocation_cache
@@ -0,0 +1,121 @@
+import io
+import os
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest side, in pixels, of the image sent to the vision model
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# City table used to reverse-geocode photo GPS offline. Needs latitude/longitude
+# columns (lat/latitude, lon/lng/longitude) next to City and Country.
+CITY_COORDINATES_PATH = os.getenv("CITY_COORDINATES_PATH", "location.csv")
+# A photo taken within this many km of a known city is attributed to it without the model
+GPS_MATCH_RADIUS_KM = float(os.getenv("GPS_MATCH_RADIUS_KM", "50"))
+
+_GPS_IFD = 0x8825
+_EARTH_RADIUS_KM = 6371.0
+
+
+def _to_degrees(dms, ref) -> float:
+    degrees, minutes, seconds = (float(v) for v in dms)
+    value = degrees + minutes / 60 + seconds / 3600
+    return -value if ref in ("S", "W") else value
+
+
+def extract_gps(image: Image.Image) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) from an image's EXIF GPS tags, or None if absent or malformed."""
+    try:
+        gps = image.getexif().get_ifd(_GPS_IFD)
+        # 1/2: latitude ref/value, 3/4: longitude ref/value
+        if not all(tag in gps for tag in (1, 2, 3, 4)):
+            return None
+        latitude = _to_degrees(gps[2], gps[1])
+        longitude = _to_degrees(gps[4], gps[3])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        return None
+    return latitude, longitude
+
+
+def prepare_image(image_data: bytes, mime_type: str = "image/jpeg",
+                  max_dimension: int = IMAGE_MAX_DIMENSION) -> Tuple[bytes, str, Optional[Tuple[float, float]]]:
+    """Shrinks an image for the vision model and strips its metadata.
+
+    The image is decoded (JPEGs at reduced scale where possible), rotated
+    upright according to its EXIF orientation, downsized so its longest side
+    is at most ``max_dimension`` and re-encoded as a JPEG without EXIF.
+
+    Returns:
+        (image bytes, mime type, GPS (latitude, longitude) or None). Bytes
+        that cannot be decoded are returned unchanged.
+    """
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            gps = extract_gps(image)
+            image.draft("RGB", (max_dimension, max_dimension))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.convert("RGB").save(output, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return image_data, mime_type, None
+    return output.getvalue(), "image/jpeg", gps
+
+
+class CityLocator:
+    """Offline reverse geocoder: nearest known city to a GPS position."""
+
+    def __init__(self, path: str = CITY_COORDINATES_PATH):
+        self.cities = np.array([], dtype=object)
+        self.coordinates = np.zeros((0, 2))
+        if not os.path.exists(path):
+            return
+        df = pd.read_csv(path, encoding='latin1')
+        columns = {c.strip().lower(): c for c in df.columns}
+        lat = next((columns[c] for c in ("lat", "latitude") if c in columns), None)
+        lon = next((columns[c] for c in ("lon", "lng", "longitude") if c in columns), None)
+        if lat is None or lon is None or "city" not in columns:
+            return
+        df = df.dropna(subset=[lat, lon, columns["city"]])
+        names = df[columns["city"]].astype(str).str.strip()
+        if "country" in columns:
+            names = names + ", " + df[columns["country"]].astype(str).str.strip()
+        self.cities = names.to_numpy()
+        self.coordinates = np.radians(df[[lat, lon]].to_numpy(dtype=float))
+
+    def __len__(self):
+        return len(self.cities)
+
+    def nearest(self, latitude: float, longitude: float,
+                max_distance_km: float = GPS_MATCH_RADIUS_KM) -> Optional[str]:
+        """"City, Country" closest to the position, or None if none is within max_distance_km."""
+        if not len(self):
+            return None
+        lat, lon = np.radians(latitude), np.radians(longitude)
+        # Haversine distance to every city at once
+        dlat = self.coordinates[:, 0] - lat
+        dlon = self.coordinates[:, 1] - lon
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(self.coordinates[:, 0]) * np.sin(dlon / 2) ** 2
+        distances = 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+        best = int(np.argmin(distances))
+        return self.cities[best] if distances[best] <= max_distance_km else None
+
+
+_locator: Optional[CityLocator] = None
+_locator_lock = threading.Lock()
+
+
+def get_city_locator() -> CityLocator:
+    """Returns the process-wide locator, loading CITY_COORDINATES_PATH on first use."""
+    global _locator
+    if _locator is None:
+        with _locator_lock:
+            if _locator is None:
+                _locator = CityLocator()
+    return _locator
@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .sqlite_util import open_db
+
+# Pipeline workers started inside each web process; set to 0 to run them only
+# in dedicated worker processes (python -m backend.worker)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+# Seconds between polls of an idle worker, and between heartbeats of a busy one
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "2"))
+# A running job without a heartbeat for this long is assumed lost (e.g. worker restarted)
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "30"))
+# Attempts before a job lost this way is marked failed instead of being re-queued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds pipeline status events are kept for sockets served by other processes
+JOB_STATUS_RETENTION = float(os.getenv("JOB_STATUS_RETENTION", "3600"))
+
+
+class JobQueue:
+    """Durable queue of pipeline jobs in SQLite.
+
+    A job is identified by ``job_id`` and optionally an ``idempotency_key``:
+    while a job with that key is queued or running, enqueueing the same key
+    returns the existing job instead of creating another. Claiming is atomic,
+    so any number of workers, in any number of processes, may share the file.
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                room_id TEXT NOT NULL,
+                idempotency_key TEXT,
+                status TEXT NOT NULL,
+                progress TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL
+            )
+        """)
+        # At most one active job per idempotency key
+        self._conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_key ON jobs (idempotency_key)
+            WHERE idempotency_key IS NOT NULL AND status IN ('queued', 'running')
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_room ON jobs (room_id, created_at)")
+        # Pipeline status events, so sockets on any process see those of pipelines run elsewhere
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS statuses (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                room_id TEXT NOT NULL,
+                event TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS statuses_room ON statuses (room_id, seq)")
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, kind: str, room_id: str, idempotency_key: Optional[str] = None) -> Tuple[Dict, bool]:
+        """Queues a job. Returns (job, created); created is False when an active job had the same key."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, kind, room_id, idempotency_key, status, created_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (job_id, kind, room_id, idempotency_key, time.time()),
+                )
+                created = True
+            except sqlite3.IntegrityError:
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE idempotency_key = ? AND status IN ('queued', 'running')",
+                    (idempotency_key,),
+                ).fetchone()
+                if row is None:
+                    raise
+                job_id, created = row["job_id"], False
+        return self.get(job_id), created
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, room_id: str, limit: int = 20) -> List[Dict]:
+        """A room's most recent jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE room_id = ? ORDER BY created_at DESC LIMIT ?", (room_id, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker: str, kinds: List[str]) -> Optional[Dict]:
+        """Atomically moves the oldest queued job of one of ``kinds`` to running and returns it."""
+        placeholders = ", ".join("?" for _ in kinds)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"""UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                        started_at = ?, heartbeat_at = ?
+                    WHERE job_id = (
+                        SELECT job_id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders})
+                        ORDER BY created_at LIMIT 1
+                    ) AND status = 'queued'
+                    RETURNING *""",
+                (worker, now, now, *kinds),
+            ).fetchone()
+        return self._to_dict(row)
+
+    def heartbeat(self, job_id: str) -> bool:
+        """Marks a running job alive; returns True if cancellation was requested."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?", (time.time(), job_id))
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def set_progress(self, job_id: str, progress: Dict):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE job_id = ?",
+                               (json.dumps(progress), time.time(), job_id))
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        """Records a running job's outcome (succeeded, failed or cancelled)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ? AND status = 'running'",
+                (status, error, time.time(), job_id),
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Cancels a queued job at once; a running job is flagged and stopped by its worker."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,)
+            )
+        return self.get(job_id)
+
+    def record_status(self, room_id: str, event: Dict) -> int:
+        """Stores a pipeline status event and returns its sequence number; drops events past JOB_STATUS_RETENTION."""
+        now = time.time()
+        with self._lock:
+            seq = self._conn.execute(
+                "INSERT INTO statuses (room_id, event, created_at) VALUES (?, ?, ?)",
+                (room_id, json.dumps(event), now),
+            ).lastrowid
+            self._conn.execute("DELETE FROM statuses WHERE created_at < ?", (now - JOB_STATUS_RETENTION,))
+        return seq
+
+    def statuses_after(self, room_id: str, after: int) -> List[Dict]:
+        """A room's status events with a sequence number greater than ``after``, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM statuses WHERE room_id = ? AND seq > ? ORDER BY seq", (room_id, after)
+            ).fetchall()
+        return [{**json.loads(row["event"]), "seq": row["seq"]} for row in rows]
+
+    def last_status_seq(self, room_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(seq) FROM statuses WHERE room_id = ?", (room_id,)).fetchone()
+        return row[0] or 0
+
+    def recover_stale(self, stale_after: float = JOB_STALE_AFTER, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """Re-queues running jobs whose worker stopped sending heartbeats; returns how many were touched.
+
+        Jobs that already used ``max_attempts`` are marked failed instead.
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            failed = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lost', finished_at = ? "
+                "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (time.time(), cutoff, max_attempts),
+            ).rowcount
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE status = 'running' AND heartbeat_at < ? AND cancel_requested = 0",
+                (cutoff,),
+            ).rowcount
+            cancelled = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (time.time(), cutoff),
+            ).rowcount
+        return failed + requeued + cancelled
+
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue at JOB_DB_PATH (default jobs.db)."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JOB_DB_PATH)
+    return _job_queue
+
+
+# Pipeline coroutine functions by job kind; each is called with the job's room_id
+Handler = Callable[[str], Awaitable[None]]
+_handlers: Dict[str, Handler] = {}
+
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job", default=None)
+
+
+def register_pipeline(kind: str, handler: Handler):
+    _handlers[kind] = handler
+
+
+def report_progress(stage: str, **details):
+    """Records the running job's current stage; does nothing outside a job."""
+    job_id = _current_job.get()
+    if job_id is not None:
+        get_job_queue().set_progress(job_id, {"stage": stage, **details})
+
+
+class WorkerPool:
+    """Runs queued jobs on ``size`` asyncio workers in the current event loop."""
+
+    def __init__(self, queue: JobQueue, size: int = JOB_WORKERS):
+        self.queue = queue
+        self.size = size
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if not _handlers:
+            raise RuntimeError("No pipelines registered; import backend.orchestrator before starting workers")
+        self.queue.recover_stale()
+        self._tasks = [asyncio.create_task(self._work(f"{self.name}:{n}")) for n in range(self.size)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, worker: str):
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, worker, list(_handlers))
+            if job is None:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                # Cheap enough to run on every idle poll; picks up jobs of crashed workers
+                await asyncio.to_thread(self.queue.recover_stale)
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict):
+        job_id = job["job_id"]
+        token = _current_job.set(job_id)
+        try:
+            task = asyncio.create_task(_handlers[job["kind"]](job["room_id"]))
+        finally:
+            _current_job.reset(token)
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=JOB_HEARTBEAT_INTERVAL)
+                if not task.done() and await asyncio.to_thread(self.queue.heartbeat, job_id):
+                    task.cancel()
+                    await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # The pool itself is stopping: leave the job running for recover_stale to re-queue
+            task.cancel()
+            raise
+        try:
+            task.result()
+            self.queue.finish(job_id, "succeeded")
+        except asyncio.CancelledError:
+            self.queue.finish(job_id, "cancelled")
+        except Exception as e:
+            print(f"Job {job_id} ({job['kind']}) failed: {e}")
+            self.queue.finish(job_id, "failed", str(e))
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, TypeAdapter
+
+from .sqlite_util import open_db
+
+# Entries kept on disk; the least recently used are evicted past this
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Seconds a stored response may be reused
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def _canonical(value: Any):
+    """JSON-serialisable stand-in for values that json.dumps cannot encode."""
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="python", exclude_none=True)
+    if isinstance(value, type) or hasattr(value, "__origin__"):
+        # A response schema: key on its JSON schema so editing the model invalidates old entries
+        try:
+            return TypeAdapter(value).json_schema()
+        except Exception:
+            return repr(value)
+    return repr(value)
+
+
+def response_cache_key(**kwargs) -> str:
+    """SHA-256 of a generate_content call's arguments (model, contents, config).
+
+    The config carries the system instructions, temperature and response schema,
+    so any change to them yields a different key.
+    """
+    payload = json.dumps(kwargs, default=_canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Size-bounded on-disk store of model response texts, keyed by response_cache_key.
+
+    SQLite in WAL mode, so entries survive restarts and are shared by every
+    worker process on the host.
+    """
+
+    def __init__(self, db_path: str = "llm_cache.db", max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl: float = LLM_CACHE_TTL):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used_at)")
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        """The stored response text, or None if missing or older than the TTL."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM responses WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return row[0]
+
+    def put(self, key: str, text: str, model: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, text, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, text, now, now),
+            )
+            # Evict the least recently used entries beyond max_entries
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        self.stats["writes"] += 1
+
+    def info(self) -> Dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"size": size, "max_entries": self.max_entries, "ttl": self.ttl, **self.stats}
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Returns the process-wide response store at LLM_CACHE_PATH (default llm_cache.db)."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache(os.getenv("LLM_CACHE_PATH", "llm_cache.db"))
+    return _llm_cache
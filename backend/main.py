@@ -1,40 +1,47 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Query
+from fastapi import FastAPI, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 from pydantic import BaseModel
 from .messages import *
 from .orchestrator import *
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import format_datetime
 from .image import get_city_image_link
+from .hotels import fetch_first_hotel
+from .cache import cache_stats
+from .quote_cache import get_quote_cache
+from .image_hash import get_geolocation_cache
+from .llm_cache import get_llm_cache
 from .prices import *
 from .imageAi import *
+from .recommendation import MAX_BATCH_GROUPS, warm_recommender, generate_recommendations_batch
+from .http_client import close_http_client
+from .jobs import JOB_WORKERS, WorkerPool, get_job_queue
+from .chat_hub import SHARED_POLL_INTERVAL
+from .rooms import DEFAULT_ROOM, get_room_id, room_path, clear_room_files, validate_room_id
+from contextlib import asynccontextmanager
+import asyncio
+import httpx
 import random
 import os
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the recommender once so the first recommendation request does not pay for it
+    warm_recommender()
+    get_quote_cache().purge_expired()
+    # Run queued pipelines in this process unless dedicated workers handle them (JOB_WORKERS=0)
+    workers = WorkerPool(get_job_queue(), JOB_WORKERS)
+    if JOB_WORKERS > 0:
+        workers.start()
+    yield
+    await workers.stop()
+    await close_http_client()
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
-
-FOURSQUARE_API_KEY = os.getenv("FOURSQUARE_API_KEY")
-if not FOURSQUARE_API_KEY:
-    raise RuntimeError("Set FOURSQUARE_API_KEY in your environment")
-
-HEADERS = {
-    "Accept": "application/json",
-    "Authorization": FOURSQUARE_API_KEY
-}
-
-def fetch_hotels(city: str, limit: int = 5):
-    resp = requests.get(
-        "https://api.foursquare.com/v3/places/search",
-        headers=HEADERS,
-        params={
-            "query": "hotel",
-            "near": city,
-            "limit": limit
-        }
-    )
-    resp.raise_for_status()
-    return resp.json().get("results", [])
 
 @app.get("/")
 def read_root():
@@ -44,54 +51,195 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters and sizes of the provider response caches, the flight quote store,
+    the image geolocation cache and the LLM response store."""
+    return {**cache_stats(), "flight_quote_store": get_quote_cache().info(),
+            "image_geolocation": get_geolocation_cache().info(), "llm_response_store": get_llm_cache().info()}
+
 @app.get("/getMessages/")
-async def get_messages():
-    messages = read_messages_from_csv()
-    return messages
+async def get_messages(request: Request, after: int = 0, room_id: str = Depends(get_room_id)):
+    """Returns the messages newer than ``after`` (all of them by default).
+
+    Responds 304 when the client's If-None-Match matches the chat's current ETag.
+    """
+    version = get_chat_version(room_id)
+    headers = {
+        "ETag": version["etag"],
+        "Cache-Control": "no-cache",
+        "X-First-Message-Id": str(version["first_id"]),
+    }
+    if version["last_timestamp"]:
+        last_modified = datetime.strptime(version["last_timestamp"], '%Y-%m-%d %H:%M:%S').astimezone()
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    if request.headers.get("if-none-match") == version["etag"]:
+        return Response(status_code=304, headers=headers)
+    messages = read_messages(room_id, after=after)
+    return JSONResponse(content=messages, headers=headers)
+
+@app.websocket("/ws/messages")
+async def messages_socket(websocket: WebSocket, after: int = 0, room_id: str = DEFAULT_ROOM):
+    """Pushes chat messages and pipeline status events as they happen.
+
+    On connect the server first sends every message newer than ``after``, then
+    streams events: ``message``, ``status``, ``cleared`` and ``resync`` (the
+    client fell behind and should re-fetch from its last message_id).
+    Events from this process arrive through the chat hub; messages and
+    statuses written by other web or job worker processes are picked up from
+    the shared stores every SHARED_POLL_INTERVAL seconds.
+    """
+    try:
+        validate_room_id(room_id)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    # Subscribe before reading the backlog so nothing published in between is lost
+    subscription = chat_hub.subscribe(room_id)
+    job_queue = get_job_queue()
+    last_sent = after
+    last_status = job_queue.last_status_seq(room_id)
+
+    async def send_new_messages():
+        nonlocal last_sent
+        for message in read_messages(room_id, after=last_sent):
+            await websocket.send_json({"type": "message", "message": message})
+            last_sent = message["message_id"]
+
+    async def send_new_statuses():
+        nonlocal last_status
+        for event in job_queue.statuses_after(room_id, last_status):
+            await websocket.send_json(event)
+            last_status = event["seq"]
+
+    async def stream():
+        nonlocal last_status
+        await send_new_messages()
+        next_poll = time.monotonic() + SHARED_POLL_INTERVAL
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), max(next_poll - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                await send_new_messages()
+                await send_new_statuses()
+                next_poll = time.monotonic() + SHARED_POLL_INTERVAL
+                continue
+            if event["type"] == "message":
+                # Another process may have stored messages in between: send them in order from the store
+                if event["message"]["message_id"] > last_sent:
+                    await send_new_messages()
+                continue
+            if event["type"] == "status":
+                if event["seq"] <= last_status:
+                    continue
+                last_status = event["seq"]
+            await websocket.send_json(event)
+
+    async def wait_for_disconnect():
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(stream()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        chat_hub.unsubscribe(subscription)
 
 @app.post("/sendMessage/")
-async def send_message(message: Message, background_tasks: BackgroundTasks):
-    """Endpoint to send a message and save it to a CSV file."""
-    messageID = save_message_to_csv(message.user_id, message.content)
-    # Check if the message is "/start" to trigger LLM processing
-    if(message.content == "Can we get some recommendations?"):
-        messageID = save_message_to_csv("System", "We are processing your request. Please wait...")
-        # Call the orchestrator function to process the messages and trip data
-        background_tasks.add_task(main_process)  
-        return {"status": "Message sent", "message_id": messageID}
-    elif(message.content == "Can we discuss possible travel dates that work for everyone?"):
-        messageID = save_message_to_csv("System", "We are processing your request. Please wait...")
-        # Call the orchestrator function to process the messages and trip data
-        background_tasks.add_task(negociation_process)  
-        return {"status": "Message sent", "message_id": messageID}
+async def send_message(message: Message, room_id: str = Depends(get_room_id)):
+    """Endpoint to send a message and save it to the message store."""
+    messageID = save_message(message.user_id, message.content, room_id)
+    kind = PIPELINE_TRIGGERS.get(message.content)
+    if kind:
+        # One active job per pipeline and room: repeated clicks return the job already queued
+        job, created = get_job_queue().enqueue(kind, room_id, idempotency_key=f"{room_id}:{kind}")
+        if created:
+            messageID = save_message("System", PROCESSING_NOTICE, room_id)
+        return {"status": "Message sent", "message_id": messageID, "job_id": job["job_id"]}
     return {"status": "Message sent", "message_id": messageID}
 
-@app.post("/sendMessageImage/")
-async def detect_location_from_image(user_data: MessageImage):
-    """
-    Endpoint to detect location from an image using Gemini API.
-    """
+@app.get("/jobs/")
+def list_jobs(room_id: str = Depends(get_room_id)):
+    """The room's most recent pipeline jobs, newest first."""
+    return get_job_queue().list(room_id)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status (queued, running, succeeded, failed, cancelled) and progress of a pipeline job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancels a queued job, or asks the worker running it to stop."""
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def _locate_image(user_id: str, content: str, image_data: bytes, mime_type: str, room_id: str):
+    """Geolocates an image with Gemini and records the upload in the room's chat."""
     try:
-        # Save the image to a file
-        save_image_to_file(user_data.image)
-        # Run the analysis with Gemini
-        location = await image_to_location()
-        save_message_to_csv(user_data.user_id, user_data.content)
-        save_message_to_csv("System", f"The user {user_data.user_id} upload a photo from {location}")
+        location = await image_bytes_to_location(image_data, mime_type)
+        save_message(user_id, content, room_id)
+        save_message("System", f"The user {user_id} upload a photo from {location}", room_id)
         return {"location": location}
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/sendMessageImage/")
+async def detect_location_from_image(user_data: MessageImage, room_id: str = Depends(get_room_id)):
+    """
+    Endpoint to detect location from a base64 image using Gemini API.
+    Prefer /uploadImage/, which avoids the base64 encoding.
+    """
+    try:
+        image_data, mime_type = decode_base64_image(user_data.image)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
+    return await _locate_image(user_data.user_id, user_data.content, image_data, mime_type, room_id)
+
+@app.post("/uploadImage/")
+async def upload_image(
+    user_id: str = Form(...),
+    content: str = Form(""),
+    image: UploadFile = File(...),
+    room_id: str = Depends(get_room_id),
+):
+    """
+    Endpoint to detect location from a multipart image upload using Gemini API.
+    The image is read in chunks into memory and rejected with 413 past IMAGE_MAX_BYTES.
+    UploadSizeLimit already refused larger request bodies before they were spooled.
+    """
+    if image.size is not None and image.size > IMAGE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+    buffer = bytearray()
+    while chunk := await image.read(64 * 1024):
+        buffer += chunk
+        if len(buffer) > IMAGE_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {IMAGE_MAX_BYTES} bytes")
+    mime_type = image.content_type or "image/jpeg"
+    return await _locate_image(user_id, content or "Image upload", bytes(buffer), mime_type, room_id)
+
 @app.post("/sendOriginAndDates/")
-async def send_origin_and_dates(trip_data: TripData):
-    """Endpoint to send origin city and trip dates and save them to a CSV file."""
-    save_trip_data_to_csv(trip_data.user_id,trip_data.origin_city, trip_data.start_date, trip_data.end_date, trip_data.origin_country)
+async def send_origin_and_dates(trip_data: TripData, room_id: str = Depends(get_room_id)):
+    """Endpoint to send origin city and trip dates and save them to the room's trips.csv."""
+    save_trip_data_to_csv(trip_data.user_id,trip_data.origin_city, trip_data.start_date, trip_data.end_date, trip_data.origin_country, room_path(room_id, "trips.csv", create=True))
     return {"status": "Trip data saved", "origin_city": trip_data.origin_city, "start_date": trip_data.start_date, "end_date": trip_data.end_date}
 
 @app.get("/recommendations/")
-async def send_origin_and_dates():
+async def get_recommendations(room_id: str = Depends(get_room_id)):
     try:
-        with open("output.json", "r", encoding="utf-8") as f:
+        with open(room_path(room_id, "output.json"), "r", encoding="utf-8") as f:
             data = json.load(f)
         return JSONResponse(content=data)
     except FileNotFoundError:
@@ -99,13 +247,31 @@ async def send_origin_and_dates():
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Invalid JSON format in output.json")
 
+@app.post("/recommendations/batch")
+def recommendations_batch(request: BatchRecommendationRequest):
+    """Score many groups' preferences in one call and return each group's top recommendations."""
+    if len(request.groups) > MAX_BATCH_GROUPS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_GROUPS} groups per request")
+    try:
+        results = generate_recommendations_batch(
+            [group.preferences for group in request.groups], top_k=request.top_k
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return [
+        {"group_id": group.group_id, **result}
+        for group, result in zip(request.groups, results)
+    ]
+
 @app.post("/negotiate/")
-async def negotiate():
-    messages = read_messages_from_csv()
+async def negotiate(room_id: str = Depends(get_room_id)):
+    messages = read_messages(room_id)
     chat_data = "\n".join([f"{msg['user_id']}: {msg['content']}" for msg in messages])
     try:
         result = await chat_with_gemini(chat_data)
         return result
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -115,7 +281,7 @@ async def get_city_image(city_name: str):
     Endpoint to get an image URL for a city
     """
     try:
-        image_url = get_city_image_link(city_name)
+        image_url = await get_city_image_link(city_name)
         return {"image_url": image_url}
     except HTTPException as e:
         raise e
@@ -123,15 +289,14 @@ async def get_city_image(city_name: str):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/clear_chat")
-async def clear_chat():
+async def clear_chat(room_id: str = Depends(get_room_id)):
     """
-    Endpoint to clear all the chat information
+    Endpoint to clear all the chat information of a room
     """
     try:
-        files_to_delete = ["output.json", "trips.csv", "messages.csv"]
-        for file in files_to_delete:
-            if os.path.exists(file):
-                os.remove(file)
+        clear_room_files(room_id)
+        get_message_store().clear(room_id)
+        chat_hub.publish({"type": "cleared"}, room_id)
         return {"detail": "Chat data cleared."}
     except HTTPException as e:
         raise e
@@ -141,19 +306,17 @@ async def clear_chat():
 @app.get("/hotels/")
 async def get_hotels(city: str):
     """
-    Returns the first hotel name and a random price between 200 and 400 for the given city.
+    Returns the first hotel name, its photo and a random price between 200 and 400 for the given city.
     """
     try:
-        places = fetch_hotels(city)
-    except requests.HTTPError as e:
+        first_hotel = await fetch_first_hotel(city)
+    except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
 
-    # Get the first hotel from the list
-    first_hotel = places[0] if places else None
     if first_hotel:
         name = first_hotel.get("name", "Unknown")
         price = random.randint(200, 400)  # Generate a random price between 200 and 400
-        hotel_data = {"name": name, "price": price}
+        hotel_data = {"name": name, "price": price, "photo_url": first_hotel.get("photo_url")}
         print("Hotel data:")
         print(hotel_data)
     else:
@@ -162,10 +325,10 @@ async def get_hotels(city: str):
     return (hotel_data)
 
 @app.get("/flight_info")
-async def flight_info(city: str, user_id: str):
+async def flight_info(city: str, user_id: str, room_id: str = Depends(get_room_id)):
     try:
         print(f"Fetching flight info for user {user_id} to {city}")
-        flight_data = skyscanner_api_request(user_id, city)
+        flight_data = await skyscanner_api_request(user_id, city, room_id)
         print("Flight data:")
         print(flight_data)
         return flight_data
@@ -173,10 +336,48 @@ async def flight_info(city: str, user_id: str):
         print(f"Error occurred while processing flight info: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class UploadSizeLimit:
+    """Rejects a request to ``path`` with 413 once its body exceeds ``max_bytes``.
+
+    Starlette parses (and spools) the whole multipart body before the endpoint
+    runs, so the size cap is enforced here, on the request stream: up front
+    from Content-Length, and while reading for chunked uploads.
+    """
+
+    def __init__(self, app, path: str, max_bytes: int):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        detail = f"Upload is larger than {self.max_bytes} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# The image may take IMAGE_MAX_BYTES; the rest covers the other form fields and multipart framing
+app.add_middleware(UploadSizeLimit, path="/uploadImage/", max_bytes=IMAGE_MAX_BYTES + 64 * 1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-First-Message-Id"],
 )
@@ -0,0 +1,372 @@
+import csv
+import os
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Optional
+
+from .sqlite_util import open_db
+
+DEFAULT_CHAT = "default"
+CSV_FIELDS = ["message_id", "user_id", "content", "timestamp"]
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class MessageStore(ABC):
+    """Append-only chat message storage.
+
+    Every chat has its own monotonic message_id sequence starting at 1.
+    Messages are returned as dicts with the same keys messages.csv used
+    (message_id, user_id, content, timestamp).
+    """
+
+    @abstractmethod
+    def append(self, user_id: str, content: str, chat_id: str = DEFAULT_CHAT) -> int:
+        """Stores a message and returns its message_id."""
+
+    @abstractmethod
+    def list(self, chat_id: str = DEFAULT_CHAT, after: int = 0) -> List[Dict]:
+        """Returns the messages of a chat with message_id greater than ``after``, oldest first."""
+
+    @abstractmethod
+    def last_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        """Returns the last message_id handed out in a chat, or 0 if it never had messages."""
+
+    @abstractmethod
+    def first_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        """Returns the lowest message_id still stored in a chat, or 0 if it is empty."""
+
+    @abstractmethod
+    def last_message(self, chat_id: str = DEFAULT_CHAT) -> Optional[Dict]:
+        """Returns the newest message of a chat, or None if it is empty."""
+
+    def data_version(self):
+        """Token that changes whenever another process writes to the store.
+
+        Caches layered on top compare it to detect writes they did not see.
+        """
+        return 0
+
+    @abstractmethod
+    def clear(self, chat_id: str = DEFAULT_CHAT):
+        """Deletes every message of a chat. The message_id sequence keeps counting,
+        so ids are never reused and cursors held by clients stay valid."""
+
+    def import_csv(self, file_path: str, chat_id: str = DEFAULT_CHAT) -> int:
+        """Appends the messages of a messages.csv file to a chat and returns how many were read."""
+        if not os.path.exists(file_path):
+            return 0
+        count = 0
+        with open(file_path, mode='r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self._append_row(chat_id, row["user_id"], row["content"], row.get("timestamp") or _timestamp())
+                count += 1
+        return count
+
+    def export_csv(self, file_path: str, chat_id: str = DEFAULT_CHAT) -> int:
+        """Writes a chat to a CSV file in the messages.csv layout and returns how many rows were written."""
+        messages = self.list(chat_id)
+        with open(file_path, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(messages)
+        return len(messages)
+
+    @abstractmethod
+    def _append_row(self, chat_id: str, user_id: str, content: str, timestamp: str) -> int:
+        """Stores a message with a given timestamp (used by import_csv) and returns its message_id."""
+
+
+class InMemoryMessageStore(MessageStore):
+    """Process-local store, mainly for tests and single-worker development."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chats: Dict[str, List[Dict]] = {}
+        self._last_ids: Dict[str, int] = {}
+
+    def append(self, user_id: str, content: str, chat_id: str = DEFAULT_CHAT) -> int:
+        return self._append_row(chat_id, user_id, content, _timestamp())
+
+    def _append_row(self, chat_id: str, user_id: str, content: str, timestamp: str) -> int:
+        with self._lock:
+            message_id = self._last_ids.get(chat_id, 0) + 1
+            self._last_ids[chat_id] = message_id
+            self._chats.setdefault(chat_id, []).append({
+                "message_id": message_id,
+                "user_id": user_id,
+                "content": content,
+                "timestamp": timestamp,
+            })
+            return message_id
+
+    def list(self, chat_id: str = DEFAULT_CHAT, after: int = 0) -> List[Dict]:
+        with self._lock:
+            messages = self._chats.get(chat_id, [])
+            if not messages:
+                return []
+            # Ids within a chat are contiguous, so the delta is a slice
+            start = min(max(after - messages[0]["message_id"] + 1, 0), len(messages))
+            return [dict(msg) for msg in messages[start:]]
+
+    def last_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            return self._last_ids.get(chat_id, 0)
+
+    def first_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            messages = self._chats.get(chat_id)
+            return messages[0]["message_id"] if messages else 0
+
+    def last_message(self, chat_id: str = DEFAULT_CHAT) -> Optional[Dict]:
+        with self._lock:
+            messages = self._chats.get(chat_id)
+            return dict(messages[-1]) if messages else None
+
+    def clear(self, chat_id: str = DEFAULT_CHAT):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+
+class SQLiteMessageStore(MessageStore):
+    """SQLite store in WAL mode, safe to share between uvicorn workers."""
+
+    def __init__(self, db_path: str = "messages.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                chat_id TEXT NOT NULL,
+                message_id INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (chat_id, message_id)
+            );
+            CREATE TABLE IF NOT EXISTS chat_counters (
+                chat_id TEXT PRIMARY KEY,
+                last_id INTEGER NOT NULL
+            );
+        """)
+
+    def append(self, user_id: str, content: str, chat_id: str = DEFAULT_CHAT) -> int:
+        return self._append_row(chat_id, user_id, content, _timestamp())
+
+    def _append_row(self, chat_id: str, user_id: str, content: str, timestamp: str) -> int:
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so the counter bump is atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO chat_counters (chat_id, last_id) VALUES (?, 1) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET last_id = last_id + 1",
+                    (chat_id,),
+                )
+                message_id = self._conn.execute(
+                    "SELECT last_id FROM chat_counters WHERE chat_id = ?", (chat_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO messages (chat_id, message_id, user_id, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    (chat_id, message_id, user_id, content, timestamp),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return message_id
+
+    def list(self, chat_id: str = DEFAULT_CHAT, after: int = 0) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, user_id, content, timestamp FROM messages "
+                "WHERE chat_id = ? AND message_id > ? ORDER BY message_id",
+                (chat_id, after),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_id FROM chat_counters WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def first_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(message_id) FROM messages WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def last_message(self, chat_id: str = DEFAULT_CHAT) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_id, user_id, content, timestamp FROM messages "
+                "WHERE chat_id = ? ORDER BY message_id DESC LIMIT 1",
+                (chat_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def data_version(self):
+        # Changes only when another connection commits; answered from the WAL index, not the data pages
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def clear(self, chat_id: str = DEFAULT_CHAT):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _ChatTail:
+    def __init__(self, messages, first_id: int, last_id: int, size: int):
+        self.messages = deque(messages, maxlen=size)
+        self.first_id = first_id
+        self.last_id = last_id
+
+
+class TailCachedMessageStore(MessageStore):
+    """Keeps the most recent messages of each chat in memory in front of another store.
+
+    Polls for new messages (``list`` with a recent ``after``), ``last_id``,
+    ``first_id`` and ``last_message`` are answered from memory. Writes go
+    through to the wrapped store. If another process writes to the wrapped
+    store (its ``data_version`` changes) the tails are dropped and reloaded.
+    """
+
+    def __init__(self, inner: MessageStore, size: int = 200):
+        self.inner = inner
+        self.size = size
+        self._lock = threading.Lock()
+        self._tails: Dict[str, _ChatTail] = {}
+        self._version = inner.data_version()
+
+    def _tail(self, chat_id: str) -> _ChatTail:
+        """Returns the tail of a chat, loading it from the wrapped store if needed. Caller holds the lock."""
+        version = self.inner.data_version()
+        if version != self._version:
+            self._tails.clear()
+            self._version = version
+        tail = self._tails.get(chat_id)
+        if tail is None:
+            last_id = self.inner.last_id(chat_id)
+            messages = self.inner.list(chat_id, after=max(last_id - self.size, 0))
+            tail = _ChatTail(messages, self.inner.first_id(chat_id), last_id, self.size)
+            self._tails[chat_id] = tail
+        return tail
+
+    def append(self, user_id: str, content: str, chat_id: str = DEFAULT_CHAT) -> int:
+        return self._append_row(chat_id, user_id, content, _timestamp())
+
+    def _append_row(self, chat_id: str, user_id: str, content: str, timestamp: str) -> int:
+        with self._lock:
+            message_id = self.inner._append_row(chat_id, user_id, content, timestamp)
+            tail = self._tails.get(chat_id)
+            if tail is None or message_id != tail.last_id + 1:
+                # Not loaded yet, or another process wrote in between; reload on next read
+                self._tails.pop(chat_id, None)
+                return message_id
+            tail.messages.append({
+                "message_id": message_id,
+                "user_id": user_id,
+                "content": content,
+                "timestamp": timestamp,
+            })
+            tail.last_id = message_id
+            if not tail.first_id:
+                tail.first_id = message_id
+            return message_id
+
+    def list(self, chat_id: str = DEFAULT_CHAT, after: int = 0) -> List[Dict]:
+        with self._lock:
+            tail = self._tail(chat_id)
+            if after >= tail.last_id or not tail.messages:
+                return []
+            # Serve from memory when the tail reaches back to the cursor or holds the whole chat
+            oldest = tail.messages[0]["message_id"]
+            if after >= oldest - 1 or oldest <= tail.first_id:
+                return [dict(msg) for msg in tail.messages if msg["message_id"] > after]
+        return self.inner.list(chat_id, after)
+
+    def last_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            return self._tail(chat_id).last_id
+
+    def first_id(self, chat_id: str = DEFAULT_CHAT) -> int:
+        with self._lock:
+            return self._tail(chat_id).first_id
+
+    def last_message(self, chat_id: str = DEFAULT_CHAT) -> Optional[Dict]:
+        with self._lock:
+            tail = self._tail(chat_id)
+            return dict(tail.messages[-1]) if tail.messages else None
+
+    def data_version(self):
+        return self.inner.data_version()
+
+    def clear(self, chat_id: str = DEFAULT_CHAT):
+        with self._lock:
+            self.inner.clear(chat_id)
+            tail = self._tails.get(chat_id)
+            if tail is not None:
+                self._tails[chat_id] = _ChatTail([], 0, tail.last_id, self.size)
+
+
+_store: Optional[MessageStore] = None
+_store_lock = threading.Lock()
+
+
+def create_message_store(backend: Optional[str] = None) -> MessageStore:
+    """Builds a store from MESSAGE_STORE ("sqlite" or "memory") and MESSAGE_DB_PATH.
+
+    The SQLite store is fronted by a TailCachedMessageStore holding the last
+    MESSAGE_TAIL_SIZE messages of each chat, so polling clients stay off disk.
+    """
+    backend = backend or os.getenv("MESSAGE_STORE", "sqlite")
+    if backend == "memory":
+        return InMemoryMessageStore()
+    if backend == "sqlite":
+        return TailCachedMessageStore(
+            SQLiteMessageStore(os.getenv("MESSAGE_DB_PATH", "messages.db")),
+            size=int(os.getenv("MESSAGE_TAIL_SIZE", "200")),
+        )
+    raise ValueError(f"Unknown message store backend: {backend}")
+
+
+def get_message_store() -> MessageStore:
+    """Returns the process-wide message store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_message_store()
+    return _store
+
+
+def set_message_store(store: MessageStore):
+    """Replaces the process-wide message store (e.g. with an InMemoryMessageStore in tests)."""
+    global _store
+    _store = store
+
+
+if __name__ == "__main__":
+    # python -m backend.message_store import|export <file.csv> [chat_id]
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in ("import", "export"):
+        print("Usage: python -m backend.message_store import|export <file.csv> [chat_id]")
+        sys.exit(1)
+    chat = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_CHAT
+    if sys.argv[1] == "import":
+        print(f"Imported {get_message_store().import_csv(sys.argv[2], chat)} messages")
+    else:
+        print(f"Exported {get_message_store().export_csv(sys.argv[2], chat)} messages")
@@ -1,70 +1,73 @@
 import csv
 import os
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 import pandas as pd
 
 from .models import * 
+from .message_store import DEFAULT_CHAT, get_message_store
+from .chat_hub import chat_hub, publish_message, publish_status
 
-def save_message_to_csv(user_id: str, content: str, file_path: str = "messages.csv") -> int:
-    """Saves a message to a CSV file and returns the message_id, which is the row number.
+# Chat messages that start a pipeline, and the job kind they queue
+PIPELINE_TRIGGERS = {
+    "Can we get some recommendations?": "recommendations",
+    "Can we discuss possible travel dates that work for everyone?": "negotiation",
+}
+
+# System notices about the pipelines themselves
+PROCESSING_NOTICE = "We are processing your request. Please wait..."
+RECOMMENDATIONS_READY_NOTICE = "The recommendations are ready. Please click the button below to see them."
+
+def save_message(user_id: str, content: str, chat_id: str = DEFAULT_CHAT) -> int:
+    """Appends a message to the message store and returns its message_id.
 
     Args:
         user_id (str): The ID of the user sending the message.
         content (str): The content of the message.
-        file_path (str): The path to the CSV file. Defaults to "messages.csv".
+        chat_id (str): The chat the message belongs to. Defaults to DEFAULT_CHAT.
 
     Returns:
-        int: The message_id, which corresponds to the row number where the message was added.
+        int: The message_id, a per-chat counter starting at 1.
     """
-    # Calculate the message_id based on the number of rows already in the file (row count)
-    message_id = 1
-    if os.path.exists(file_path):
-        with open(file_path, mode='r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            # Skip header row if it exists
-            next(reader, None)
-            message_id = sum(1 for row in reader) + 1  # Increment row count for new message_id
-
-    # Get the current timestamp
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Format the timestamp
-
-    # Open the CSV file in append mode
-    with open(file_path, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        
-        # Write the header if the file is empty
-        if f.tell() == 0:
-            writer.writerow(["message_id", "user_id", "content", "timestamp"])  # Write header
-        
-        # Write the message as a new row, including timestamp
-        writer.writerow([message_id, user_id, content, timestamp])  # Write message with timestamp
-
+    store = get_message_store()
+    message_id = store.append(user_id, content, chat_id)
+    if chat_hub.subscriber_count(chat_id):
+        for message in store.list(chat_id, after=message_id - 1)[:1]:
+            publish_message(message, chat_id)
     return message_id
 
-def read_messages_from_csv(file_path: str = "messages.csv") -> List[Dict[str, str]]:
-    """Reads messages from a CSV file and returns them as a list of dictionaries.
+def read_messages(chat_id: str = DEFAULT_CHAT, after: int = 0) -> List[Dict]:
+    """Reads the messages of a chat from the message store.
 
     Args:
-        file_path (str): The path to the CSV file. Defaults to "messages.csv".
+        chat_id (str): The chat to read. Defaults to DEFAULT_CHAT.
+        after (int): Only return messages with a message_id greater than this. Defaults to 0.
 
     Returns:
-        List[Dict[str, str]]: A list of messages, where each message is represented as a dictionary.
+        List[Dict]: A list of messages, where each message is represented as a dictionary.
     """
-    messages = []
+    return get_message_store().list(chat_id, after)
 
-    # Check if the file exists before attempting to read
-    if not os.path.exists(file_path):
-        # If the file doesn't exist, return an empty list
-        return messages
-    
-    # Open the CSV file for reading
-    with open(file_path, mode='r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)  # Use DictReader to read rows as dictionaries
-        for row in reader:
-            messages.append(row)  # Append each row (message) to the list
+def get_chat_version(chat_id: str = DEFAULT_CHAT) -> Dict:
+    """Describes the current state of a chat without reading its messages.
 
-    return messages
+    Args:
+        chat_id (str): The chat to describe. Defaults to DEFAULT_CHAT.
+
+    Returns:
+        Dict: first_id and last_id of the stored messages, the timestamp of the
+        newest message (or None) and an ETag that changes whenever the chat does.
+    """
+    store = get_message_store()
+    first_id = store.first_id(chat_id)
+    last_id = store.last_id(chat_id)
+    last_message = store.last_message(chat_id)
+    return {
+        "first_id": first_id,
+        "last_id": last_id,
+        "last_timestamp": last_message["timestamp"] if last_message else None,
+        "etag": f'"{chat_id}-{first_id}-{last_id}"',
+    }
 
 
 def load_trip_data_from_csv(file_path: str) -> list[TripData]:
@@ -96,17 +99,20 @@ def load_trip_data_from_csv(file_path: str) -> list[TripData]:
     return trips
 
 
-def get_llm_formatted_chat(messages_file: str) -> str:
+def get_llm_formatted_chat(chat_id: str = DEFAULT_CHAT, after: int = 0, messages: Optional[List[Dict]] = None) -> str:
     """Endpoint to send messages and trip data to the LLM.
 
     Args:
-        messages_file (str): The path to the CSV file containing messages.
+        chat_id (str): The chat whose messages are formatted. Defaults to DEFAULT_CHAT.
+        after (int): Only messages with a larger message_id are included. Defaults to 0 (all).
+        messages (list): Already loaded messages to format instead of reading the chat.
 
     Returns:
         str: Formatted input string for the LLM.
     """
     # Read messages and trip data
-    messages = read_messages_from_csv(messages_file)
+    if messages is None:
+        messages = read_messages(chat_id, after=after)
 
     # Send the formatted data to the LLM API
     formatted_chat_data = "\n".join(f"{msg['user_id']}: {msg['content']}" for msg in messages)
@@ -186,7 +192,7 @@ if __name__ == "__main__":
     for origin_city, start_date, end_date in sample_trips:
         save_trip_data_to_csv(origin_city, start_date, end_date)
 
-    # Generate sample messages.csv
+    # Generate sample messages
     sample_messages = [
         ("User1", "I love hiking and exploring nature."),
         ("User2", "I prefer relaxing on the beach and enjoying the sun."),
@@ -194,10 +200,10 @@ if __name__ == "__main__":
     ]
     
     for user_id, content in sample_messages:
-        save_message_to_csv(user_id, content)
+        save_message(user_id, content)
 
     # Get formatted input for the LLM
-    formatted_input = get_llm_formatted_chat('messages.csv')
+    formatted_input = get_llm_formatted_chat()
     
     # Print the formatted input
     print(formatted_input)
@@ -11,6 +11,14 @@ class TravelPreference(BaseModel):
     veto: Optional[List[str]] = []
     favoured_city: Optional[List[str]] = []
 
+class GroupPreferences(BaseModel):
+    group_id: str
+    preferences: List[TravelPreference]
+
+class BatchRecommendationRequest(BaseModel):
+    groups: List[GroupPreferences]
+    top_k: int = 10
+
 class Message(BaseModel):
     user_id: str
     content: str
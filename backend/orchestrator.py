@@ -4,61 +4,90 @@ from .negociation_chat import *
 import asyncio
 import json
 from .prices import *
+from .hotels import prefetch_hotels
 from typing import List
 from .models import TravelPreference  # Import the model for type hints
 from .recommendation import RobustCityRecommender, generate_recommendations  # Import the recommender class
+from .rooms import DEFAULT_ROOM, room_path
+from .jobs import register_pipeline, report_progress
+from .preferences import get_group_preferences
+from .date_solver import solve_date_overlap, format_date_suggestion
 
-async def main_process():
-    # Step 1: Get formatted input from CSV files
-    llm_message = get_llm_formatted_chat(messages_file="messages.csv")
-    
-    # Step 2: Get JSON response from Gemini
-    llm_json: List[TravelPreference] = await chat_with_gemini(llm_message)
-    
-    # Save the JSON response to a file for debugging
-    llm_json_dict = [pref.dict() for pref in llm_json]
-    with open('llm_response.json', 'w') as f:
-            json.dump(llm_json_dict, f, indent=2)
-
-    # Step 3: Call the recommendation script
+async def main_process(room_id: str = DEFAULT_ROOM):
+    publish_status("recommendations", "processing", room_id)
+    # Every step up to "ready" is inside the try, so a Gemini timeout also reaches clients as "failed"
     try:
-        recommendations = generate_recommendations(llm_json)
+        # Steps 1-2: Extract preferences with Gemini from the messages sent since the last run
+        report_progress("extracting_preferences")
+        llm_json: List[TravelPreference] = await get_group_preferences(room_id)
+
+        # Save the JSON response to a file for debugging
+        llm_json_dict = [pref.dict() for pref in llm_json]
+        with open(room_path(room_id, 'llm_response.json', create=True), 'w') as f:
+                json.dump(llm_json_dict, f, indent=2)
+
+        # Step 3: Call the recommendation script
+        report_progress("ranking")
+        recommendations = generate_recommendations(llm_json, room_path(room_id, 'output.json', create=True))
+        if not recommendations:
+            raise RuntimeError("No recommendations generated")
         print("Recommendations generated successfully:")
         print(recommendations)
 
         #Step 4: Let the user know the recommendations
-        save_message_to_csv("System", "The recommendations are ready. Please click the button below to see them.")
+        save_message("System", RECOMMENDATIONS_READY_NOTICE, room_id)
+        publish_status("recommendations", "ready", room_id)
     except ImportError:
         print("Error: recommendation.py not found")
+        publish_status("recommendations", "failed", room_id)
+        raise
     except Exception as e:
         print(f"Error running recommendation script: {e}")
-        """
-    # Step 4: Calling SkyScanner API
-    with open('recommendation/output.json', 'r') as recommendation_output:
-        json_data = json.loads(recommendation_output)
-    prices = query_flight_prices(json_data, origin_city, origin_country, travel_go_date, travel_return_date)
-    # Insert the 'price' attribute into each city
-    i = 0
-    for city in json_data['cities']:
-        city = prices[i]
-        i += 1
-    with open('output_price.json', 'w') as json_file:
-        json_file.write(json_data)"""
+        publish_status("recommendations", "failed", room_id, detail=str(e))
+        raise
 
-async def negociation_process():
+    # Step 5: Price every traveller's round trip to every recommended city in one batch,
+    # while warming the hotel cache for the same cities
+    report_progress("pricing")
+    with open(room_path(room_id, 'output.json'), 'r', encoding='utf-8') as f:
+        cities = [rec['city'] for rec in json.load(f).get('top_recommendations', [])]
+    await asyncio.gather(_price_recommendations(room_id), prefetch_hotels(cities))
+
+async def _price_recommendations(room_id: str):
+    publish_status("prices", "processing", room_id)
     try:
-        # Step 1: Get formatted input from CSV files
-        llm_message = get_llm_formatted_date(trips_file="trips.csv")
-        
-        # Step 2: Get JSON response from Gemini
-        llm_response = await negociate_with_gemini(llm_message)
+        await attach_price_matrix(room_id)
+        publish_status("prices", "ready", room_id)
+    except Exception as e:
+        print(f"Error building price matrix: {e}")
+        publish_status("prices", "failed", room_id, detail=str(e))
+
+async def negociation_process(room_id: str = DEFAULT_ROOM):
+    publish_status("negotiation", "processing", room_id)
+    try:
+        # Step 1: Find the earliest dates most travellers can make from the room's trips.csv
+        report_progress("negotiating")
+        trips = load_trip_data_from_csv(room_path(room_id, "trips.csv"))
+        suggestion = format_date_suggestion(solve_date_overlap(trips))
 
-        save_message_to_csv("System", llm_response)
+        # Step 2: Optionally let Gemini reword it for the chat
+        if NEGOTIATION_LLM_PHRASING:
+            suggestion = await phrase_date_suggestion_with_gemini(suggestion)
+
+        save_message("System", suggestion, room_id)
+        publish_status("negotiation", "ready", room_id)
         
     except ImportError:
         print("Error: recommendation.py not found")
+        publish_status("negotiation", "failed", room_id)
+        raise
     except Exception as e:
         print(f"Error running recommendation script: {e}")
+        publish_status("negotiation", "failed", room_id, detail=str(e))
+        raise
+
+register_pipeline("recommendations", main_process)
+register_pipeline("negotiation", negociation_process)
 
 # Run the main process
 if __name__ == "__main__":
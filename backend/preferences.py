@@ -0,0 +1,74 @@
+import json
+import os
+from typing import Dict, List
+
+from .chat import chat_with_gemini, update_preferences_with_gemini
+from .messages import (PIPELINE_TRIGGERS, PROCESSING_NOTICE, RECOMMENDATIONS_READY_NOTICE, get_llm_formatted_chat,
+                       read_messages)
+from .models import TravelPreference
+from .rooms import DEFAULT_ROOM, room_path
+
+PREFERENCES_FILE = "preferences.json"
+
+
+def load_preference_state(room_id: str = DEFAULT_ROOM) -> Dict:
+    """The room's extracted preferences and the last message_id they cover.
+
+    Returns {"last_message_id": 0, "preferences": []} when nothing was extracted yet.
+    """
+    path = room_path(room_id, PREFERENCES_FILE)
+    if not os.path.exists(path):
+        return {"last_message_id": 0, "preferences": []}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    state["preferences"] = [TravelPreference(**pref) for pref in state["preferences"]]
+    return state
+
+
+def save_preference_state(room_id: str, last_message_id: int, preferences: List[TravelPreference]):
+    path = room_path(room_id, PREFERENCES_FILE, create=True)
+    state = {"last_message_id": last_message_id, "preferences": [pref.model_dump() for pref in preferences]}
+    # Write then rename, so a reader never sees half a file
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _is_preference_message(message: Dict) -> bool:
+    """Pipeline notices and trigger phrases say nothing about preferences.
+
+    Other System messages stay: photo uploads are recorded as "The user X
+    upload a photo from <location>", which tells Gemini where X likes to go.
+    """
+    if message["content"] in PIPELINE_TRIGGERS:
+        return False
+    return not (message["user_id"] == "System"
+                and message["content"] in (PROCESSING_NOTICE, RECOMMENDATIONS_READY_NOTICE))
+
+
+async def get_group_preferences(room_id: str = DEFAULT_ROOM) -> List[TravelPreference]:
+    """Every user's TravelPreference for a room, updated incrementally.
+
+    The first call sends the whole chat to Gemini. Later calls send only the
+    messages after the last processed message_id together with the stored
+    preferences, and make no model call at all when no user has written
+    anything new. The result is persisted in the room's preferences.json.
+    """
+    state = load_preference_state(room_id)
+    new_messages = read_messages(room_id, after=state["last_message_id"])
+    if not new_messages:
+        return state["preferences"]
+
+    last_message_id = new_messages[-1]["message_id"]
+    relevant = [message for message in new_messages if _is_preference_message(message)]
+    if not relevant:
+        preferences = state["preferences"]
+    elif not state["preferences"]:
+        preferences = await chat_with_gemini(get_llm_formatted_chat(room_id, messages=relevant))
+    else:
+        preferences = await update_preferences_with_gemini(
+            state["preferences"], get_llm_formatted_chat(room_id, messages=relevant)
+        )
+
+    save_preference_state(room_id, last_message_id, preferences)
+    return preferences
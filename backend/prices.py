@@ -1,13 +1,25 @@
-from datetime import datetime
-import requests
+from datetime import datetime, date
+import asyncio
 import json
 from .messages import *
+from .rooms import DEFAULT_ROOM, room_path
+from . import http_client
+from .cache import cached
+from .quote_cache import get_quote_cache
+from .recommendation import rerank_by_cost
+from .airports import get_airport_index, normalize_city
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 API_KEY = os.getenv("SKYSCANNER_API_KEY")
 
+# Maximum airport-pair quote requests in flight for one get_flight_price call
+FLIGHT_QUOTE_CONCURRENCY = int(os.getenv("FLIGHT_QUOTE_CONCURRENCY", "8"))
+
+# Maximum legs priced at once when building a room's price matrix
+PRICE_MATRIX_CONCURRENCY = int(os.getenv("PRICE_MATRIX_CONCURRENCY", "8"))
+
 URL_PRICES = 'https://partners.api.skyscanner.net/apiservices/v3/flights/indicative/search'
 URL_AIRPORTS = 'https://partners.api.skyscanner.net/apiservices/v3/autosuggest/flights'
 headers = {
@@ -15,7 +27,27 @@ headers = {
     'x-api-key': API_KEY
 }
 
-def get_city_iata_codes(city, country):
+async def get_city_iata_codes(city, country):
+    """IATA codes for a city, resolved offline when possible.
+
+    A complete entry in the local index (exact city and country match) is
+    answered without the network. Otherwise the Skyscanner autosuggest
+    endpoint is asked, through the "airport_codes" provider cache; if it
+    fails or finds nothing, the partial local entry (if any) is used.
+    """
+    index = get_airport_index()
+    local_codes, complete = index.lookup(city, country)
+    if complete:
+        return local_codes
+    codes = await fetch_city_iata_codes(index.canonical_name(city, country), country)
+    return codes or local_codes
+
+@cached("airport_codes", key=lambda city, country: (normalize_city(city), normalize_city(country)))
+async def fetch_city_iata_codes(city, country):
+    """IATA codes for a city from the Skyscanner autosuggest endpoint.
+
+    Returns None when the call fails, so the failure is not cached.
+    """
     query_search_payload = {
         "query": {
             "market": "ES",
@@ -27,23 +59,107 @@ def get_city_iata_codes(city, country):
         }
     }
 
-    response = requests.post(URL_AIRPORTS, headers=headers, json=query_search_payload)
-    iata_codes = []
+    response = await http_client.post(URL_AIRPORTS, headers=headers, json=query_search_payload)
+    if response.status_code != 200:
+        print(f"Error: {response.status_code}, {response.text}")
+        return None
 
-    if response.status_code == 200:
-        data = response.json()
-        for place in data.get("places", []):
-            iata_code = place.get("iataCode")
-            city_name = place.get("cityName")
-            country_name = place.get("countryName")
-            country_code = place.get("countryId")
-            if country_code == "US":
-                country_code = "USA"
-            if iata_code and city in city_name and (country_name == country or country_code == country):
-                iata_codes.append(iata_code)
+    iata_codes = []
+    data = response.json()
+    for place in data.get("places", []):
+        iata_code = place.get("iataCode")
+        city_name = place.get("cityName")
+        country_name = place.get("countryName")
+        country_code = place.get("countryId")
+        if country_code == "US":
+            country_code = "USA"
+        if iata_code and city in city_name and (country_name == country or country_code == country):
+            iata_codes.append(iata_code)
     return iata_codes
 
-def get_flight_price(origin_city: str, origin_country: str, destination_city: str, destination_country: str, travel_date: str):
+async def get_route_quote(origin_iata: str, destination_iata: str, year: int, month: int, day: int):
+    """Cheapest indicative quote for one airport pair on one day, or None.
+
+    Served from the shared on-disk quote cache while the quote is within its
+    quote_ttl; concurrent misses for the same route and day share one request.
+    """
+    flight_info = get_quote_cache().get(origin_iata, destination_iata, date(year, month, day))
+    if flight_info is not None:
+        return flight_info
+    return await fetch_route_quote(origin_iata, destination_iata, year, month, day)
+
+@cached("flight_quotes")
+async def fetch_route_quote(origin_iata: str, destination_iata: str, year: int, month: int, day: int):
+    """Cheapest indicative quote from the Skyscanner API, stored in the on-disk quote cache."""
+    query_payload = {
+        "query": {
+            "market": "ES",
+            "locale": "en-GB",
+            "currency": "EUR",
+            "queryLegs": [
+                {
+                    "originPlace": {
+                        "queryPlace": {
+                            "iata": origin_iata
+                        }
+                    },
+                    "destinationPlace": {
+                        "queryPlace": {
+                            "iata": destination_iata
+                        }
+                    },
+                    "fixedDate": {
+                        "year": year,
+                        "month": month,
+                        "day": day
+                    },
+                }
+            ],
+            "dateTimeGroupingType": "DATE_TIME_GROUPING_TYPE_UNSPECIFIED"
+        }
+    }
+
+    response = await http_client.post(URL_PRICES, headers=headers, json=query_payload)
+
+    if response.status_code != 200:
+        print(f"Error: {response.status_code}, {response.text}")
+        return None
+
+    data = response.json()
+
+    # Extract quotes and carriers
+    quotes = data['content']['results']['quotes']
+    carriers = data['content']['results']['carriers']
+    places = data['content']['results']['places']
+
+    flight_info = None
+    for quote_key, quote in quotes.items():
+        price = int(quote['minPrice']['amount'])
+        if flight_info is not None and price >= flight_info['price']:
+            continue
+        outbound_leg = quote['outboundLeg']
+
+        # Extract relevant details
+        departure_time = outbound_leg['departureDateTime']  # assuming outbound leg for departure time
+        origin = places[str(outbound_leg['originPlaceId'])]['name']
+        destination = places[str(outbound_leg['destinationPlaceId'])]['name']
+
+        # Get airline information
+        airline = carriers[str(outbound_leg['marketingCarrierId'])]['name']
+
+        flight_info = {
+            'departure_time': departure_time,
+            'origin': origin,
+            'destination': destination,
+            'airline': airline,
+            'price': price,
+            'is_direct': quote['isDirect']
+        }
+    if flight_info is not None:
+        get_quote_cache().put(origin_iata, destination_iata, date(year, month, day), flight_info)
+    return flight_info
+
+async def get_flight_price(origin_city: str, origin_country: str, destination_city: str, destination_country: str, travel_date: str):
     try:
         travel_date_obj = datetime.strptime(travel_date, '%Y-%m-%d')
         year = travel_date_obj.year
@@ -54,88 +170,36 @@ def get_flight_price(origin_city: str, origin_country: str, destination_city: st
         return None
 
     # Get IATA codes for the origin and destination cities
-    iata_codes_destination = get_city_iata_codes(destination_city, destination_country)
-    iata_codes_origin = get_city_iata_codes(origin_city, origin_country)
-
-    cheapest_price = float('inf')
-
-    for origin_iata in iata_codes_origin:
-        for destination_iata in iata_codes_destination:
-            query_payload = {
-                "query": {
-                    "market": "ES",
-                    "locale": "en-GB",
-                    "currency": "EUR",
-                    "queryLegs": [
-                        {
-                            "originPlace": {
-                                "queryPlace": {
-                                    "iata": origin_iata
-                                }
-                            },
-                            "destinationPlace": {
-                                "queryPlace": {
-                                    "iata": destination_iata
-                                }
-                            },
-                            "fixedDate": {
-                                "year": year,
-                                "month": month,
-                                "day": day
-                            },
-                        }
-                    ],
-                    "dateTimeGroupingType": "DATE_TIME_GROUPING_TYPE_UNSPECIFIED"
-                }
-            }
-
-            response = requests.post(URL_PRICES, headers=headers, json=query_payload)
-
-            if response.status_code == 200:
-                data = response.json()
-
-                # Extract quotes and carriers
-                quotes = data['content']['results']['quotes']
-                carriers = data['content']['results']['carriers']
-                places = data['content']['results']['places']
-
-                for quote_key, quote in quotes.items():
-                    price = int(quote['minPrice']['amount'])
-                    is_direct = quote['isDirect']
-                    outbound_leg = quote['outboundLeg']
-                    inbound_leg = quote['inboundLeg']
-
-                    # Extract relevant details
-                    departure_time = outbound_leg['departureDateTime']  # assuming outbound leg for departure time
-                    origin_place_id = outbound_leg['originPlaceId']
-                    destination_place_id = outbound_leg['destinationPlaceId']
-
-                    origin = places[str(origin_place_id)]['name']
-                    destination = places[str(destination_place_id)]['name']
-
-                    # Get airline information
-                    carrier_id = outbound_leg['marketingCarrierId']
-                    airline = carriers[str(carrier_id)]['name']
-
-                    formatted_date = format_flight_date(departure_time)
-
-                    # Always check for the cheapest price
-                    if price < cheapest_price:
-                        cheapest_price = price
-                        flight_info = {
-                            'departure_time': departure_time,
-                            'origin': origin,
-                            'destination': destination,
-                            'airline': airline,
-                            'price': price,
-                            'is_direct': is_direct
-                        }
-                
-            else:
-                print(f"Error: {response.status_code}, {response.text}")
-                return None
+    iata_codes_destination, iata_codes_origin = await asyncio.gather(
+        get_city_iata_codes(destination_city, destination_country),
+        get_city_iata_codes(origin_city, origin_country),
+    )
+
+    # Quote every airport pair at once, at most FLIGHT_QUOTE_CONCURRENCY in flight
+    limit = asyncio.Semaphore(FLIGHT_QUOTE_CONCURRENCY)
+
+    async def quote_pair(origin_iata, destination_iata):
+        async with limit:
+            return await get_route_quote(origin_iata, destination_iata, year, month, day)
+
+    pairs = [
+        quote_pair(origin_iata, destination_iata)
+        for origin_iata in iata_codes_origin
+        for destination_iata in iata_codes_destination
+    ]
+
+    # Keep the cheapest quote as results arrive; a failed pair does not sink the others
+    flight_info = None
+    for next_quote in asyncio.as_completed(pairs):
+        try:
+            quote = await next_quote
+        except Exception as e:
+            print(f"Error fetching flight quote: {e}")
+            continue
+        if quote is not None and (flight_info is None or quote['price'] < flight_info['price']):
+            flight_info = quote
 
-    return flight_info if flight_info else None
+    return flight_info
 
 def format_flight_date(flight_date: dict):
     # Extract the components from the dictionary
@@ -154,16 +218,92 @@ def format_flight_date(flight_date: dict):
 
     return formatted_date
 
-def skyscanner_api_request(user_id, destination_city):
-    # Load the JSON data from the file
-    with open("output.json", "r", encoding="utf-8") as f:  # Ensure the filename matches your actual file
+def format_round_trip(outbound, inbound):
+    """The outbound/inbound summary returned by /flight_info, or None if a leg is missing."""
+    if not outbound or not inbound:
+        return None
+    fields = ("departure_time", "origin", "destination", "airline", "price")
+    return {
+        "outbound": {field: outbound[field] for field in fields},
+        "inbound": {field: inbound[field] for field in fields},
+    }
+
+async def build_price_matrix(trips, recommendations):
+    """Round-trip prices from every traveller's origin to every recommended city.
+
+    Legs shared by several travellers (same origin, destination and date) are
+    fetched once, and all distinct legs are fetched concurrently, at most
+    PRICE_MATRIX_CONCURRENCY at a time.
+
+    Args:
+        trips: list of TripData for the room's travellers.
+        recommendations: the "top_recommendations" list from output.json.
+
+    Returns:
+        dict: {user_id: {city: {"outbound": {...}, "inbound": {...}} or None}}.
+    """
+    legs = {}
+    for trip in trips:
+        for recommendation in recommendations:
+            city, country = recommendation["city"], recommendation["country"]
+            legs[(trip.origin_city, trip.origin_country, city, country, trip.start_date)] = None
+            legs[(city, country, trip.origin_city, trip.origin_country, trip.end_date)] = None
+
+    limit = asyncio.Semaphore(PRICE_MATRIX_CONCURRENCY)
+
+    async def price_leg(leg):
+        async with limit:
+            try:
+                legs[leg] = await get_flight_price(*leg)
+            except Exception as e:
+                print(f"Error pricing {leg}: {e}")
+
+    await asyncio.gather(*(price_leg(leg) for leg in list(legs)))
+
+    matrix = {}
+    for trip in trips:
+        matrix[trip.user_id] = {
+            recommendation["city"]: format_round_trip(
+                legs[(trip.origin_city, trip.origin_country, recommendation["city"], recommendation["country"], trip.start_date)],
+                legs[(recommendation["city"], recommendation["country"], trip.origin_city, trip.origin_country, trip.end_date)],
+            )
+            for recommendation in recommendations
+        }
+    return matrix
+
+async def attach_price_matrix(room_id=DEFAULT_ROOM):
+    """Prices the room's recommendations for all its travellers, stores the matrix in
+    output.json and re-ranks the recommendations by match score and group cost."""
+    output_path = room_path(room_id, "output.json")
+    with open(output_path, "r", encoding="utf-8") as f:
+        json_data = json.load(f)
+    trips = load_trip_data_from_csv(room_path(room_id, 'trips.csv'))
+
+    json_data["price_matrix"] = await build_price_matrix(trips, json_data.get("top_recommendations", []))
+    # Surface the cities that are both a good match and cheap for the whole group
+    json_data["top_recommendations"] = rerank_by_cost(json_data.get("top_recommendations", []), json_data["price_matrix"])
+
+    # Clients may already be reading output.json: write then rename, so they never see half a file
+    with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(json_data, f, indent=2)
+    os.replace(output_path + ".tmp", output_path)
+    return json_data["price_matrix"]
+
+async def skyscanner_api_request(user_id, destination_city, room_id=DEFAULT_ROOM):
+    # Load the room's recommendations
+    with open(room_path(room_id, "output.json"), "r", encoding="utf-8") as f:
         json_data = json.load(f)
     
     for recommendation in json_data.get("top_recommendations", []):
         if recommendation.get("city") == destination_city:
             destination_country = recommendation.get("country")
             
-    trips = load_trip_data_from_csv('trips.csv')
+    # Use the precomputed price matrix when the pipeline already priced this trip
+    precomputed = json_data.get("price_matrix", {}).get(user_id, {}).get(destination_city)
+    if precomputed:
+        return precomputed
+
+    trips = load_trip_data_from_csv(room_path(room_id, 'trips.csv'))
 
     # Find the trip for the specified user_id
     trip = next((t for t in trips if t.user_id == user_id), None)
@@ -178,33 +318,15 @@ def skyscanner_api_request(user_id, destination_city):
     start_date = trip.start_date
     end_date = trip.end_date
 
-    with open('backend/data/iata.json', 'r') as file:
-        iata_codes = json.load(file)
-    
-    # Vuelos de ida
-    info_fligh1 = get_flight_price(origin_city, origin_country, destination_city, destination_country, start_date)
-
-    # Vuelos de vuelta
-    info_fligh2 = get_flight_price(destination_city, destination_country, origin_city, origin_country, end_date)
-
-    # Add botwh flight info to the JSON data
-    if info_fligh1 and info_fligh2:
-        json_data['flight_info'] = {
-            "outbound": {
-                "departure_time": info_fligh1['departure_time'],
-                "origin": info_fligh1['origin'],
-                "destination": info_fligh1['destination'],
-                "airline": info_fligh1['airline'],
-                "price": info_fligh1['price']
-            },
-            "inbound": {
-                "departure_time": format_flight_date,
-                "origin": info_fligh2['origin'],
-                "destination": info_fligh2['destination'],
-                "airline": info_fligh2['airline'],
-                "price": info_fligh2['price']
-            }
-        }
+    # Vuelos de ida y de vuelta, en paralelo
+    info_fligh1, info_fligh2 = await asyncio.gather(
+        get_flight_price(origin_city, origin_country, destination_city, destination_country, start_date),
+        get_flight_price(destination_city, destination_country, origin_city, origin_country, end_date),
+    )
+
+    # Add both flight info to the JSON data
+    flight_info = format_round_trip(info_fligh1, info_fligh2)
+    if flight_info:
+        json_data['flight_info'] = flight_info
     
     return json_data['flight_info']
-
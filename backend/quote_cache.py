@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional
+
+from .sqlite_util import open_db
+
+# A quote for a flight N days away stays valid for N * QUOTE_TTL_PER_DAY seconds,
+# clamped to [QUOTE_TTL_MIN, QUOTE_TTL_MAX]: far-off fares move slowly, near-term ones quickly.
+QUOTE_TTL_PER_DAY = float(os.getenv("QUOTE_TTL_PER_DAY", "1800"))
+QUOTE_TTL_MIN = float(os.getenv("QUOTE_TTL_MIN", "3600"))
+QUOTE_TTL_MAX = float(os.getenv("QUOTE_TTL_MAX", str(3 * 24 * 3600)))
+
+
+def quote_ttl(travel_date: date, today: Optional[date] = None) -> float:
+    """Seconds a quote for ``travel_date`` may be reused; 0 for dates in the past."""
+    days_ahead = (travel_date - (today or date.today())).days
+    if days_ahead < 0:
+        return 0
+    return min(max(days_ahead * QUOTE_TTL_PER_DAY, QUOTE_TTL_MIN), QUOTE_TTL_MAX)
+
+
+class FlightQuoteCache:
+    """Durable cache of indicative flight quotes keyed by (origin IATA, destination IATA, date).
+
+    Backed by SQLite in WAL mode so it survives restarts and is shared by
+    every uvicorn worker on the host. Hit/miss counters are per process.
+    """
+
+    def __init__(self, db_path: str = "flight_quotes.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS quotes (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                travel_date TEXT NOT NULL,
+                quote TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (origin, destination, travel_date)
+            )
+        """)
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def get(self, origin: str, destination: str, travel_date: date) -> Optional[Dict]:
+        """The cached quote for a route and day, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT quote FROM quotes WHERE origin = ? AND destination = ? AND travel_date = ? AND expires_at > ?",
+                (origin, destination, travel_date.isoformat(), time.time()),
+            ).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, origin: str, destination: str, travel_date: date, quote: Dict):
+        """Stores a quote; quotes for past dates are not kept."""
+        ttl = quote_ttl(travel_date)
+        if ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quotes (origin, destination, travel_date, quote, fetched_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (origin, destination, travel_date.isoformat(), json.dumps(quote), now, now + ttl),
+            )
+        self.stats["writes"] += 1
+
+    def purge_expired(self) -> int:
+        """Deletes expired quotes and returns how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM quotes WHERE expires_at <= ?", (time.time(),))
+        return cursor.rowcount
+
+    def info(self) -> Dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+        return {"size": size, **self.stats}
+
+
+_quote_cache: Optional[FlightQuoteCache] = None
+_quote_cache_lock = threading.Lock()
+
+
+def get_quote_cache() -> FlightQuoteCache:
+    """Returns the process-wide quote cache at QUOTE_CACHE_PATH (default flight_quotes.db)."""
+    global _quote_cache
+    if _quote_cache is None:
+        with _quote_cache_lock:
+            if _quote_cache is None:
+                _quote_cache = FlightQuoteCache(os.getenv("QUOTE_CACHE_PATH", "flight_quotes.db"))
+    return _quote_cache
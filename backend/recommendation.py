@@ -1,23 +1,31 @@
 import json
+import os
+import threading
 import numpy as np
 import pandas as pd
 from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import PolynomialFeatures, MinMaxScaler
 from sklearn.pipeline import make_pipeline
 from sklearn.impute import SimpleImputer
-from sklearn.metrics.pairwise import cosine_similarity
 import warnings
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
 
+CITY_DATA_PATH = 'backend/data/enhanced_cities.csv'
+LOCATION_DATA_PATH = 'location.csv'
+# recommend_batch scores this many groups per matrix product, bounding its groups x cities arrays
+RECOMMEND_BATCH_CHUNK = int(os.getenv('RECOMMEND_BATCH_CHUNK', '256'))
+# Largest number of groups /recommendations/batch accepts in one request
+MAX_BATCH_GROUPS = int(os.getenv('RECOMMEND_MAX_BATCH_GROUPS', '5000'))
+
 class RobustCityRecommender:
     def __init__(self, data_path):
         # Load and validate city data
         self.df = pd.read_csv(data_path, encoding='latin1')
         
         # Load and filter cities from location.csv
-        location_df = pd.read_csv('location.csv', encoding='latin1')
+        location_df = pd.read_csv(LOCATION_DATA_PATH, encoding='latin1')
         self.df = self.df[self.df['city'].isin(location_df['City'])]
             
         self._validate_data()
@@ -27,13 +35,14 @@ class RobustCityRecommender:
                             if col not in ('city', 'country', 'city_cluster')]
         self._prepare_features()
         
-        # Build model pipeline with imputation
-        self.model = self._build_model()
+        # The MLP is only needed for train(), so it is built lazily there
+        self.model = None
         self.city_to_idx = {city: idx for idx, city in enumerate(self.df['city'])}
         self.vetoed_cities = set()
         self.favoured_city = None  # New attribute to store favoured city
         self.scaler = MinMaxScaler()
         self.X_scaled = self.scaler.fit_transform(self.df[self.base_features])
+        self._prepare_ranking_index()
 
     def _validate_data(self):
         """Ensure data is clean and valid"""
@@ -48,6 +57,119 @@ class RobustCityRecommender:
         self.X = self.poly.fit_transform(self.df[self.base_features])
         self.feature_names = [str(f) for f in self.poly.get_feature_names_out(self.base_features)]
 
+    def _prepare_ranking_index(self):
+        """Precompute the arrays recommend() ranks against"""
+        # Row-normalised city matrix, so cosine similarity is a single dot product
+        norms = np.linalg.norm(self.X_scaled, axis=1, keepdims=True)
+        self.X_normalized = self.X_scaled / (norms + 1e-8)
+        self.city_names = self.df['city'].to_numpy()
+        self.countries = self.df['country'].to_numpy()
+        self.city_names_lower = np.array([str(city).lower() for city in self.city_names])
+        self.city_index = {city: idx for idx, city in enumerate(self.city_names_lower)}
+        self.feature_index = {feat: idx for idx, feat in enumerate(self.base_features)}
+        self.feature_values = self.df[self.base_features].to_numpy(dtype=float)
+
+    def veto_mask(self, vetoed_cities):
+        """Boolean mask over the city table, True for vetoed cities"""
+        mask = np.zeros(len(self.city_names_lower), dtype=bool)
+        for city in vetoed_cities:
+            idx = self.city_index.get(city)
+            if idx is not None:
+                mask[idx] = True
+        return mask
+
+    def preference_vector(self, preferences):
+        """Unit-length preference vector aligned with base_features"""
+        user_vec = np.array([preferences.get(feat, 0) for feat in self.base_features], dtype=float)
+        return user_vec / (np.linalg.norm(user_vec) + 1e-8)
+
+    @staticmethod
+    def top_k_indices(scores, excluded, k):
+        """Indices of the k highest scores not excluded, best first"""
+        candidates = np.flatnonzero(~excluded)
+        if k <= 0 or candidates.size == 0:
+            return candidates[:0]
+        candidate_scores = scores[candidates]
+        if candidates.size > k:
+            part = np.argpartition(-candidate_scores, k - 1)[:k]
+        else:
+            part = np.arange(candidates.size)
+        order = part[np.argsort(-candidate_scores[part], kind='stable')]
+        return candidates[order]
+
+    def _format_recommendation(self, idx, match_score, preferences):
+        return {
+            'city': self.city_names[idx],
+            'country': self.countries[idx],
+            'match_score': match_score,
+            'features': {f: float(self.feature_values[idx, self.feature_index[f]]) for f in preferences.keys()}
+        }
+
+    def recommend_batch(self, groups, top_k=10):
+        """Rank cities for many groups at once.
+
+        Args:
+            groups: list of (preferences, vetoed_cities, favoured_city) tuples,
+                as returned by aggregate_group.
+            top_k: number of recommendations per group.
+
+        Returns:
+            list of recommendation lists, one per group, in the same format as recommend().
+
+        Groups are ranked RECOMMEND_BATCH_CHUNK at a time, so memory stays at
+        chunk x cities scores however many groups are passed.
+        """
+        results = []
+        for start in range(0, len(groups), RECOMMEND_BATCH_CHUNK):
+            results.extend(self._recommend_chunk(groups[start:start + RECOMMEND_BATCH_CHUNK], top_k))
+        return results
+
+    def _recommend_chunk(self, groups, top_k):
+        """recommend_batch for one chunk of groups"""
+        if not groups:
+            return []
+        n_cities = len(self.city_names)
+        
+        # One (groups x features) @ (features x cities) product scores every group
+        user_matrix = np.vstack([self.preference_vector(prefs) for prefs, _, _ in groups])
+        similarities = user_matrix @ self.X_normalized.T
+        
+        excluded = np.zeros((len(groups), n_cities), dtype=bool)
+        favoured_indices = []
+        for row, (_, vetoed_cities, favoured_city) in enumerate(groups):
+            excluded[row] = self.veto_mask(vetoed_cities)
+            favoured_idx = self.city_index.get(favoured_city) if favoured_city else None
+            if favoured_idx is not None and not excluded[row, favoured_idx]:
+                excluded[row, favoured_idx] = True
+            else:
+                favoured_idx = None
+            favoured_indices.append(favoured_idx)
+        
+        k = min(top_k, n_cities)
+        if k <= 0:
+            return [[] for _ in groups]
+        masked = np.where(excluded, -np.inf, similarities)
+        if k < n_cities:
+            part = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n_cities), (len(groups), 1))
+        order = np.argsort(-np.take_along_axis(masked, part, axis=1), axis=1, kind='stable')
+        winners = np.take_along_axis(part, order, axis=1)
+        
+        results = []
+        for row, (prefs, _, _) in enumerate(groups):
+            recommendations = []
+            if favoured_indices[row] is not None:
+                recommendations.append(self._format_recommendation(favoured_indices[row], 100.0, prefs))
+            for idx in winners[row]:
+                if len(recommendations) >= top_k or excluded[row, idx]:
+                    break
+                recommendations.append(
+                    self._format_recommendation(idx, round(float(similarities[row, idx] * 100), 1), prefs)
+                )
+            results.append(recommendations)
+        return results
+
     def _build_model(self):
         """Build robust pipeline with imputation"""
         return make_pipeline(
@@ -61,21 +183,27 @@ class RobustCityRecommender:
             )
         )
 
-    def calculate_aggregate_preferences(self, users_data):
-        """Calculate weighted mean preferences safely"""
+    def aggregate_group(self, users_data):
+        """Aggregate one group's preferences without touching instance state.
+
+        Returns a (preferences, vetoed_cities, favoured_city) tuple.
+        """
         agg_prefs = {feat: [] for feat in self.base_features}
-        self.vetoed_cities = set()
-        self.favoured_city = None  # Reset favoured city
+        vetoed_cities = set()
+        favoured_city = None
         
         for user in [u.dict() if hasattr(u, 'dict') else u for u in users_data]:
             if 'veto' in user:
                 if isinstance(user['veto'], list):
-                    self.vetoed_cities.update(city.lower() for city in user['veto'])
+                    vetoed_cities.update(city.lower() for city in user['veto'])
                 else:
-                    self.vetoed_cities.add(str(user['veto']).lower())
+                    vetoed_cities.add(str(user['veto']).lower())
             
             if 'favoured' in user:  # Check for favoured city
-                self.favoured_city = str(user['favoured']).lower()
+                favoured_city = str(user['favoured']).lower()
+            elif user.get('favoured_city'):
+                favoured = user['favoured_city']
+                favoured_city = str(favoured[-1] if isinstance(favoured, list) else favoured).lower()
             
             try:
                 user_total = max(sum(tag['score'] for tag in user['tags']), 1e-6)
@@ -90,6 +218,11 @@ class RobustCityRecommender:
         for feat, values in agg_prefs.items():
             if values:
                 final_prefs[feat] = np.nanmean(values) if values else 0
+        return final_prefs, vetoed_cities, favoured_city
+
+    def calculate_aggregate_preferences(self, users_data):
+        """Calculate weighted mean preferences safely"""
+        final_prefs, self.vetoed_cities, self.favoured_city = self.aggregate_group(users_data)
         return final_prefs
 
     def train(self, default_cities=None):
@@ -98,64 +231,41 @@ class RobustCityRecommender:
         X_train = self.X
         y_train = np.arange(len(self.df))  # Each city is its own class
         
+        if self.model is None:
+            self.model = self._build_model()
         self.model.fit(X_train, y_train)
 
     def recommend(self, preferences, top_k=10):
         """Get top 10 recommendations from location.csv with favoured city prioritization"""
         try:
-            # Create user preference vector
-            user_vec = np.array([preferences.get(feat, 0) for feat in self.base_features])
-            
-            # Normalize user vector
-            user_vec = user_vec / (np.linalg.norm(user_vec) + 1e-8)
+            user_vec = self.preference_vector(preferences)
             
-            # Calculate cosine similarity with all cities
-            similarities = cosine_similarity(
-                user_vec.reshape(1, -1), 
-                self.X_scaled
-            )[0]
+            # Cosine similarity with every city in one matrix-vector product
+            similarities = self.X_normalized @ user_vec
+            excluded = self.veto_mask(self.vetoed_cities)
             
-            # Get top recommendations excluding vetoed cities
             recommendations = []
-            favoured_city_added = False
             
             # First check if favoured city exists and should be added
-            if self.favoured_city:
-                favoured_idx = None
-                for idx, city in enumerate(self.df['city']):
-                    if str(city).lower() == self.favoured_city:
-                        favoured_idx = idx
-                        break
-                
-                if favoured_idx is not None and self.favoured_city not in self.vetoed_cities:
-                    recommendations.append({
-                        'city': self.df.iloc[favoured_idx]['city'],
-                        'country': self.df.iloc[favoured_idx]['country'],
-                        'match_score': 100.0,  # Max score for favoured city
-                        'features': {f: float(self.df.iloc[favoured_idx][f]) for f in preferences.keys()}
-                    })
-                    favoured_city_added = True
+            favoured_idx = self.city_index.get(self.favoured_city) if self.favoured_city else None
+            if favoured_idx is not None and not excluded[favoured_idx]:
+                recommendations.append(
+                    self._format_recommendation(favoured_idx, 100.0, preferences)  # Max score for favoured city
+                )
+                excluded[favoured_idx] = True
             
-            # Add other cities
-            for idx in np.argsort(similarities)[::-1]:
-                city_name = str(self.df.iloc[idx]['city']).lower()
-                if (city_name not in self.vetoed_cities and 
-                    (not favoured_city_added or city_name != self.favoured_city)):
-                    recommendations.append({
-                        'city': self.df.iloc[idx]['city'],
-                        'country': self.df.iloc[idx]['country'],
-                        'match_score': round(float(similarities[idx] * 100), 1),
-                        'features': {f: float(self.df.iloc[idx][f]) for f in preferences.keys()}
-                    })
-                    if len(recommendations) >= top_k:
-                        break
+            # Add other cities; dicts are only built for the winners
+            for idx in self.top_k_indices(similarities, excluded, top_k - len(recommendations)):
+                recommendations.append(
+                    self._format_recommendation(idx, round(float(similarities[idx] * 100), 1), preferences)
+                )
             
             return recommendations
         
         except Exception as e:
             print(f"Recommendation error: {e}")
             # Fallback to random cities from location.csv
-            location_df = pd.read_csv('location.csv', encoding='latin1')
+            location_df = pd.read_csv(LOCATION_DATA_PATH, encoding='latin1')
             fallback_cities = location_df['City'].sample(min(10, len(location_df))).tolist()
             
             # Include favoured city in fallback if specified
@@ -173,44 +283,161 @@ class RobustCityRecommender:
                            for f in preferences.keys()}
             } for city in fallback_cities[:top_k]]
 
-def generate_recommendations(users_data):
-    """Main function to generate recommendations"""
-    print("Initializing recommendation system...")
-    
+_recommender = None
+_recommender_mtimes = None
+_recommender_lock = threading.Lock()
+
+def _source_mtimes():
+    """Modification times of the CSV files the recommender is built from"""
+    return tuple(os.path.getmtime(path) for path in (CITY_DATA_PATH, LOCATION_DATA_PATH))
+
+def get_recommender():
+    """Return the process-wide recommender, rebuilding it only if the source CSVs changed.
+
+    Callers must hold ``_recommender_lock`` while calling ``calculate_aggregate_preferences``
+    and ``recommend``, since those store veto state on the instance. ``aggregate_group``
+    and ``recommend_batch`` are stateless and can run without it.
+    """
+    global _recommender, _recommender_mtimes
+    mtimes = _source_mtimes()
+    if _recommender is None or mtimes != _recommender_mtimes:
+        print("Initializing recommendation system...")
+        _recommender = RobustCityRecommender(CITY_DATA_PATH)
+        _recommender_mtimes = mtimes
+    return _recommender
+
+def warm_recommender():
+    """Build the shared recommender ahead of the first request (called on app startup)"""
+    with _recommender_lock:
+        get_recommender()
+
+def generate_recommendations(users_data, output_path='output.json'):
+    """Main function to generate recommendations and save them to output_path"""
     try:
-        recommender = RobustCityRecommender('backend/data/enhanced_cities.csv')
-        
-        print("Training model...")
-        recommender.train()
-        print("Model trained successfully!")
-        
-        print("Calculating aggregate preferences...")
-        agg_prefs = recommender.calculate_aggregate_preferences(users_data)
-        
-        print("Generating recommendations...")
-        results = recommender.recommend(agg_prefs, top_k=10)
+        with _recommender_lock:
+            recommender = get_recommender()
+            
+            print("Calculating aggregate preferences...")
+            agg_prefs = recommender.calculate_aggregate_preferences(users_data)
+            vetoed_cities = list(recommender.vetoed_cities)
+            
+            print("Generating recommendations...")
+            results = recommender.recommend(agg_prefs, top_k=10)
         
         if not results:
             raise ValueError("No recommendations generated")
         
         output = {
             "aggregate_preferences": {k: float(v) for k, v in agg_prefs.items()},
-            "vetoed_cities": list(recommender.vetoed_cities),
+            "vetoed_cities": vetoed_cities,
             "top_recommendations": results
         }
         
         print("Recommendations:")
         print(json.dumps(output, indent=2))
 
-        with open('output.json', 'w') as f:
+        with open(output_path, 'w') as f:
             json.dump(output, f, indent=2)
         
-        print("Successfully saved recommendations to output.json")
+        print(f"Successfully saved recommendations to {output_path}")
         return True
     
     except Exception as e:
         print(f"Fatal error: {e}")
         return False
 
+def generate_recommendations_batch(groups, top_k=10):
+    """Generate recommendations for many groups in one pass.
+
+    Args:
+        groups: list of groups, each a list of TravelPreference (or equivalent dicts).
+        top_k: number of recommendations per group.
+
+    Returns:
+        list of dicts shaped like output.json, one per group. Nothing is written to disk.
+    """
+    with _recommender_lock:
+        recommender = get_recommender()
+    
+    aggregated = [recommender.aggregate_group(users_data) for users_data in groups]
+    results = recommender.recommend_batch(aggregated, top_k=top_k)
+    
+    return [{
+        "aggregate_preferences": {k: float(v) for k, v in prefs.items()},
+        "vetoed_cities": list(vetoed_cities),
+        "top_recommendations": recommendations
+    } for (prefs, vetoed_cities, _), recommendations in zip(aggregated, results)]
+
+def pareto_ranks(objectives):
+    """Pareto front index of each row of an (n, m) array of objectives to minimise.
+
+    Rank 0 is the non-dominated front, rank 1 the front left once rank 0 is
+    removed, and so on.
+    """
+    objectives = np.asarray(objectives, dtype=float)
+    n = len(objectives)
+    # dominates[i, j]: i is no worse than j on every objective and better on one
+    no_worse = (objectives[:, None, :] <= objectives[None, :, :]).all(axis=2)
+    better = (objectives[:, None, :] < objectives[None, :, :]).any(axis=2)
+    dominates = no_worse & better
+
+    ranks = np.full(n, -1)
+    remaining = np.ones(n, dtype=bool)
+    front = 0
+    while remaining.any():
+        dominated = (dominates & remaining[:, None]).any(axis=0)
+        current = remaining & ~dominated
+        ranks[current] = front
+        remaining &= ~current
+        front += 1
+    return ranks
+
+def rerank_by_cost(recommendations, price_matrix):
+    """Re-rank recommendations by match score and the group's flight cost.
+
+    Each city's total and maximum per-traveller round-trip price are taken
+    from the price matrix built by ``prices.build_price_matrix``. Cities are
+    ordered by Pareto front over (highest match score, lowest total price,
+    lowest maximum price), then by match score within a front. A city that
+    could not be priced for every traveller counts as infinitely expensive.
+
+    Args:
+        recommendations: the "top_recommendations" list from output.json.
+        price_matrix: {user_id: {city: {"outbound": {...}, "inbound": {...}} or None}}.
+
+    Returns:
+        list: the recommendations with 'total_price', 'max_price' and
+        'pareto_rank' added, best first.
+    """
+    if not recommendations:
+        return []
+    cities = [rec['city'] for rec in recommendations]
+    users = list(price_matrix)
+
+    # prices[u, c]: round-trip price of traveller u to city c, inf when unknown
+    prices = np.full((len(users), len(cities)), np.inf)
+    for u, user_id in enumerate(users):
+        for c, city in enumerate(cities):
+            trip = price_matrix[user_id].get(city)
+            if trip:
+                prices[u, c] = trip['outbound']['price'] + trip['inbound']['price']
+
+    scores = np.array([rec['match_score'] for rec in recommendations], dtype=float)
+    if users:
+        total = prices.sum(axis=0)
+        worst = prices.max(axis=0)
+    else:
+        # Nobody to price for: rank by match score alone
+        total = worst = np.full(len(cities), np.inf)
+
+    ranks = pareto_ranks(np.column_stack([-scores, total, worst]))
+    order = np.lexsort((-scores, ranks))
+    return [{
+        **recommendations[idx],
+        'total_price': float(total[idx]) if np.isfinite(total[idx]) else None,
+        'max_price': float(worst[idx]) if np.isfinite(worst[idx]) else None,
+        'pareto_rank': int(ranks[idx]),
+    } for idx in order]
+
 if __name__ == "__main__":
     generate_recommendations()
\ No newline at end of file
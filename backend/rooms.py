@@ -0,0 +1,57 @@
+import os
+import re
+import shutil
+
+from fastapi import HTTPException, Query
+
+from .message_store import DEFAULT_CHAT
+
+# A room is one trip group. Its messages live in the message store under chat_id=room_id
+# and its files (trips.csv, output.json, llm_response.json, preferences.json) under ROOMS_DIR/<room_id>/.
+DEFAULT_ROOM = DEFAULT_CHAT
+ROOMS_DIR = os.getenv("ROOMS_DIR", "rooms")
+ROOM_FILES = ["output.json", "trips.csv", "llm_response.json", "preferences.json"]
+
+_ROOM_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def validate_room_id(room_id: str) -> str:
+    """Rejects room ids that could escape ROOMS_DIR. Returns the id unchanged."""
+    if not _ROOM_ID_PATTERN.match(room_id):
+        raise HTTPException(status_code=400, detail="room_id must be 1-64 letters, digits, '-' or '_'")
+    return room_id
+
+
+def get_room_id(room_id: str = Query(DEFAULT_ROOM)) -> str:
+    """FastAPI dependency reading the optional ``room_id`` query parameter."""
+    return validate_room_id(room_id)
+
+
+def room_dir(room_id: str = DEFAULT_ROOM) -> str:
+    """Directory holding a room's files. The default room keeps the legacy top-level files."""
+    if room_id == DEFAULT_ROOM:
+        return "."
+    return os.path.join(ROOMS_DIR, validate_room_id(room_id))
+
+
+def room_path(room_id: str, filename: str, create: bool = False) -> str:
+    """Path of one of a room's files.
+
+    Writers pass ``create=True`` to create the room directory first; reads
+    of an unknown room leave nothing behind.
+    """
+    directory = room_dir(room_id)
+    if create:
+        os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+def clear_room_files(room_id: str = DEFAULT_ROOM):
+    """Deletes a room's files (not its messages)."""
+    if room_id == DEFAULT_ROOM:
+        for filename in ROOM_FILES:
+            path = room_path(room_id, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    else:
+        shutil.rmtree(room_dir(room_id), ignore_errors=True)
@@ -0,0 +1,15 @@
+import sqlite3
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    """Opens a SQLite database shared by threads and worker processes.
+
+    The connection may be used from any thread (callers serialise access with
+    their own lock), autocommits each statement, returns sqlite3.Row rows and
+    runs in WAL mode, so readers in other processes never block writers.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
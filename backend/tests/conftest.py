@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+# The Gemini client and hotels.py refuse to load without keys; tests never reach the real APIs
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("FOURSQUARE_API_KEY", "test")
+
+from backend import airports, cache, http_client, quote_cache
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    """A StubTransport behind the shared HTTP client, with every provider cache empty."""
+    transport = http_client.StubTransport()
+    http_client.set_transport(transport)
+    monkeypatch.setattr(cache, "_caches", {})
+    monkeypatch.setattr(airports, "_index", None)
+    monkeypatch.setattr(quote_cache, "_quote_cache", quote_cache.FlightQuoteCache(str(tmp_path / "quotes.db")))
+    yield transport
+    http_client.set_transport(None)
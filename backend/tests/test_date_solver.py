@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from backend.date_solver import format_date_suggestion, solve_date_overlap
+from backend.models import TripData
+
+
+def _trip(user_id, start, end):
+    return TripData(user_id=user_id, origin_city="Madrid", origin_country="Spain", start_date=start, end_date=end)
+
+
+def _brute_force(trips, alternatives):
+    """Day-by-day reference: maximal runs of days with the same attendees, ranked like the solver."""
+    first = min(date.fromisoformat(t.start_date) for t in trips)
+    last = max(date.fromisoformat(t.end_date) for t in trips)
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    available = np.array([[date.fromisoformat(t.start_date) <= day <= date.fromisoformat(t.end_date) for t in trips]
+                          for day in days])
+    runs, start = [], 0
+    for i in range(1, len(days) + 1):
+        if i == len(days) or not np.array_equal(available[i], available[start]):
+            if available[start].any():
+                runs.append((int(available[start].sum()), start, i - 1))
+            start = i
+    runs.sort(key=lambda run: (-run[0], run[1]))
+    users = np.array([t.user_id for t in trips])
+    return [{"start": days[s].isoformat(), "end": days[e].isoformat(), "attendees": users[available[s]].tolist(),
+             "excluded": users[~available[s]].tolist()} for _, s, e in runs[:alternatives + 1]]
+
+
+def test_sweep_line_matches_day_by_day_brute_force():
+    rng = np.random.default_rng(0)
+    trips = []
+    for i in range(5000):
+        start = date(2030, 1, 1) + timedelta(days=int(rng.integers(0, 300)))
+        trips.append(_trip(f"u{i}", start.isoformat(), (start + timedelta(days=int(rng.integers(0, 30)))).isoformat()))
+
+    result = solve_date_overlap(trips, alternatives=3)
+
+    assert [result["best"], *result["alternatives"]] == _brute_force(trips, 3)
+    assert result["participants"] == 5000 and result["invalid"] == []
+
+
+def test_invalid_and_reversed_dates_are_reported_not_scheduled():
+    trips = [
+        _trip("ann", "2030-05-03", "2030-05-10"),
+        _trip("bob", "2030-05-06", "2030-05-14"),
+        _trip("cat", "2030-05-12", "2030-05-01"),
+        _trip("dan", "next week", "2030-05-20"),
+    ]
+
+    result = solve_date_overlap(trips, alternatives=1)
+
+    assert result["invalid"] == ["cat", "dan"] and result["participants"] == 2
+    assert result["best"] == {"start": "2030-05-06", "end": "2030-05-10", "attendees": ["ann", "bob"], "excluded": []}
+    assert format_date_suggestion(result) == (
+        "Suggested Dates: 2030-05-06 to 2030-05-10\n"
+        "Reason: All 2 travellers are available.\n"
+        "Alternative: 2030-05-03 to 2030-05-05 (1 of 2 available)\n"
+        "Could not read the dates of: cat, dan"
+    )
+
+
+def test_suggestion_without_valid_dates():
+    result = solve_date_overlap([_trip("ann", "2030-05-10", "2030-05-01")])
+
+    assert result["best"] is None
+    assert format_date_suggestion(result) == "Suggested Dates: none\nReason: Nobody has shared valid travel dates yet."
@@ -0,0 +1,34 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.hotels import prefetch_hotels
+
+SEARCH = "https://api.foursquare.com/v3/places/search"
+PHOTOS = "https://api.foursquare.com/v3/places/"
+
+
+def _foursquare(stub):
+    stub.add("GET", SEARCH, json={"results": [{"fsq_id": f"h{i}", "name": f"Hotel {i}"} for i in range(5)]})
+    stub.add("GET", PHOTOS + "h", json=[{"prefix": "https://img/", "suffix": ".jpg"}])
+
+
+def test_hotels_endpoint_fetches_one_photo(stub):
+    _foursquare(stub)
+
+    hotel = TestClient(main.app).get("/hotels/", params={"city": "Lisbon"}).json()
+
+    assert hotel["name"] == "Hotel 0" and hotel["photo_url"] == "https://img/original.jpg"
+    assert len(stub.requests) == 2
+    assert [str(r.url.path) for r in stub.calls("GET", PHOTOS + "h")] == ["/v3/places/h0/photos"]
+
+
+def test_hotels_endpoint_is_served_from_prefetched_caches(stub):
+    _foursquare(stub)
+    assert asyncio.run(prefetch_hotels(["Lisbon"])) == 1
+    prefetched = len(stub.requests)
+
+    TestClient(main.app).get("/hotels/", params={"city": "Lisbon"})
+
+    assert prefetched == 6 and len(stub.requests) == prefetched
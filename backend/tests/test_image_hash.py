@@ -0,0 +1,47 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from backend.image_hash import GeolocationCache, dhash
+
+
+def encode(image, size=None, quality=90):
+    if size is not None:
+        image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def photo(seed):
+    """A detailed test image: smoothed random noise."""
+    noise = np.random.default_rng(seed).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    return Image.fromarray(noise).resize((640, 480), Image.Resampling.BICUBIC)
+
+
+def test_recompressed_copy_of_a_photo_matches():
+    cache = GeolocationCache()
+    cache.remember(encode(photo(1)), "Paris")
+
+    assert cache.lookup(encode(photo(1), size=(320, 240), quality=60)) == "Paris"
+    assert cache.lookup(encode(photo(2))) is None
+
+
+def test_flat_images_only_match_exactly():
+    sky, night = encode(Image.new("RGB", (640, 480), (120, 170, 230))), encode(Image.new("RGB", (640, 480), (5, 5, 10)))
+    assert dhash(sky) == dhash(night)
+
+    cache = GeolocationCache()
+    cache.remember(sky, "Paris")
+
+    assert cache.lookup(night) is None
+    assert cache.lookup(sky) == "Paris"
+
+
+def test_unreadable_bytes_only_match_exactly():
+    cache = GeolocationCache()
+    cache.remember(b"not an image", "Rome")
+
+    assert cache.lookup(b"not an image") == "Rome"
+    assert cache.lookup(b"not an image either") is None
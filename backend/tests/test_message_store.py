@@ -0,0 +1,23 @@
+import pytest
+
+from backend.message_store import InMemoryMessageStore, MessageStore
+
+
+def test_incomplete_store_fails_when_created():
+    class AppendOnly(MessageStore):
+        def append(self, user_id, content, chat_id="default"):
+            return 1
+
+    with pytest.raises(TypeError, match="abstract"):
+        AppendOnly()
+
+
+def test_csv_round_trip(tmp_path):
+    store = InMemoryMessageStore()
+    store.append("ann", "Hi", "trip1")
+    store.append("bob", "Hello", "trip1")
+    assert store.export_csv(str(tmp_path / "messages.csv"), "trip1") == 2
+
+    copy = InMemoryMessageStore()
+    assert copy.import_csv(str(tmp_path / "messages.csv"), "trip1") == 2
+    assert copy.list("trip1") == store.list("trip1")
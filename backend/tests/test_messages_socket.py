@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+
+from backend import jobs, main, message_store
+from backend.jobs import JobQueue
+from backend.message_store import SQLiteMessageStore, TailCachedMessageStore
+
+
+def test_socket_delivers_what_other_processes_write(monkeypatch, tmp_path):
+    messages_db, jobs_db = str(tmp_path / "messages.db"), str(tmp_path / "jobs.db")
+    monkeypatch.setattr(message_store, "_store", TailCachedMessageStore(SQLiteMessageStore(messages_db)))
+    monkeypatch.setattr(jobs, "_job_queue", JobQueue(jobs_db))
+    monkeypatch.setattr(main, "SHARED_POLL_INTERVAL", 0.05)
+    main.save_message("ann", "Hi", "trip1")
+
+    # Stand-ins for another web process and a dedicated job worker sharing the same files
+    other_store, worker_queue = SQLiteMessageStore(messages_db), JobQueue(jobs_db)
+
+    with TestClient(main.app).websocket_connect("/ws/messages?room_id=trip1") as socket:
+        assert socket.receive_json()["message"]["content"] == "Hi"
+
+        other_store.append("bob", "Hello from worker B", "trip1")
+        assert socket.receive_json()["message"]["content"] == "Hello from worker B"
+
+        worker_queue.record_status("trip1", {"type": "status", "pipeline": "recommendations", "status": "ready"})
+        other_store.append("System", "The recommendations are ready.", "trip1")
+        events = [socket.receive_json(), socket.receive_json()]
+
+    assert {"type": "status", "pipeline": "recommendations", "status": "ready", "seq": 1} in events
+    assert {"type": "message", "message": other_store.list("trip1", after=2)[0]} in events
+
+
+def test_status_published_in_process_is_sent_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(message_store, "_store", TailCachedMessageStore(SQLiteMessageStore(str(tmp_path / "m.db"))))
+    monkeypatch.setattr(jobs, "_job_queue", JobQueue(str(tmp_path / "jobs.db")))
+    monkeypatch.setattr(main, "SHARED_POLL_INTERVAL", 0.05)
+    main.save_message("ann", "Hi", "trip1")
+
+    with TestClient(main.app).websocket_connect("/ws/messages?room_id=trip1") as socket:
+        # The backlog arrives once the socket is subscribed
+        assert socket.receive_json()["message"]["content"] == "Hi"
+        main.publish_status("negotiation", "processing", "trip1")
+        main.save_message("System", "done", "trip1")
+        first, second = socket.receive_json(), socket.receive_json()
+
+    assert first == {"type": "status", "pipeline": "negotiation", "status": "processing", "seq": 1}
+    assert second["message"]["content"] == "done"
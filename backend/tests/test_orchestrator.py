@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+from backend import jobs, orchestrator
+from backend.jobs import JobQueue
+
+
+def test_preference_timeout_is_published_as_failed(monkeypatch, tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_job_queue", queue)
+
+    async def get_group_preferences(room_id):
+        raise TimeoutError("Gemini did not answer in time")
+
+    monkeypatch.setattr(orchestrator, "get_group_preferences", get_group_preferences)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(orchestrator.main_process("trip1"))
+
+    assert [(e["status"], e.get("detail")) for e in queue.statuses_after("trip1", 0)] == [
+        ("processing", None), ("failed", "Gemini did not answer in time")]
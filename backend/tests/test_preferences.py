@@ -0,0 +1,28 @@
+import asyncio
+
+from backend import message_store, preferences, rooms
+from backend.message_store import InMemoryMessageStore
+from backend.messages import PROCESSING_NOTICE, save_message
+from backend.models import TravelPreference
+
+
+def test_photo_locations_reach_gemini_but_pipeline_notices_do_not(monkeypatch, tmp_path):
+    monkeypatch.setattr(message_store, "_store", InMemoryMessageStore())
+    monkeypatch.setattr(rooms, "ROOMS_DIR", str(tmp_path))
+    transcripts = []
+
+    async def chat_with_gemini(transcript):
+        transcripts.append(transcript)
+        return [TravelPreference(user="ann", tags=[])]
+
+    monkeypatch.setattr(preferences, "chat_with_gemini", chat_with_gemini)
+    save_message("ann", "I love beaches", "trip1")
+    save_message("System", "The user ann upload a photo from Lisbon, Portugal", "trip1")
+    save_message("ann", "Can we get some recommendations?", "trip1")
+    save_message("System", PROCESSING_NOTICE, "trip1")
+
+    asyncio.run(preferences.get_group_preferences("trip1"))
+
+    [transcript] = transcripts
+    assert "I love beaches" in transcript and "Lisbon, Portugal" in transcript
+    assert "recommendations?" not in transcript and PROCESSING_NOTICE not in transcript
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import httpx
+
+from backend import prices
+from backend.quote_cache import get_quote_cache
+from backend.http_client import request_json
+
+TRAVEL_DATE = "2030-05-04"
+
+
+def autosuggest(places):
+    """Autosuggest handler answering every search with ``places`` (city, country, IATA code)."""
+    def handler(request):
+        return httpx.Response(200, json={"places": [
+            {"iataCode": code, "cityName": city, "countryName": country, "countryId": country[:2].upper()}
+            for city, country, code in places
+        ]})
+    return handler
+
+
+def indicative_quotes(prices_by_route):
+    """Indicative search handler quoting prices_by_route[(origin, destination)]; other routes get 400."""
+    def handler(request):
+        leg = request_json(request)["query"]["queryLegs"][0]
+        route = (leg["originPlace"]["queryPlace"]["iata"], leg["destinationPlace"]["queryPlace"]["iata"])
+        if route not in prices_by_route:
+            return httpx.Response(400, json={"error": "no quotes"})
+        return httpx.Response(200, json={"content": {"results": {
+            "quotes": {"q1": {
+                "minPrice": {"amount": str(prices_by_route[route])},
+                "isDirect": True,
+                "outboundLeg": {"departureDateTime": {"year": 2030, "month": 5, "day": 4},
+                                "originPlaceId": 1, "destinationPlaceId": 2, "marketingCarrierId": 9},
+            }},
+            "carriers": {"9": {"name": "Stub Air"}},
+            "places": {"1": {"name": route[0]}, "2": {"name": route[1]}},
+        }}})
+    return handler
+
+
+def searched_terms(stub):
+    return [request_json(r)["query"]["searchTerm"] for r in stub.calls("POST", prices.URL_AIRPORTS)]
+
+
+def test_flight_price_quotes_every_airport_pair_and_keeps_the_cheapest(stub):
+    stub.add("POST", prices.URL_AIRPORTS, handler=autosuggest([
+        ("Glasgow", "United Kingdom", "GLA"), ("Glasgow", "United Kingdom", "PIK"),
+        ("Venice", "Italy", "VCE"), ("Venice", "Italy", "TSF"), ("Venice", "United States", "VNC"),
+    ]))
+    stub.add("POST", prices.URL_PRICES, handler=indicative_quotes({
+        ("GLA", "VCE"): 120, ("PIK", "VCE"): 95, ("PIK", "TSF"): 45,
+    }))
+
+    quote = asyncio.run(prices.get_flight_price("Glasgow", "United Kingdom", "Venice", "Italy", TRAVEL_DATE))
+
+    assert quote["price"] == 45
+    assert (quote["origin"], quote["destination"]) == ("PIK", "TSF")
+    # GLA-TSF failed, which must not sink the other pairs; VNC is in another country
+    routes = {(leg["originPlace"]["queryPlace"]["iata"], leg["destinationPlace"]["queryPlace"]["iata"])
+              for leg in (request_json(r)["query"]["queryLegs"][0] for r in stub.calls("POST", prices.URL_PRICES))}
+    assert routes == {("GLA", "VCE"), ("GLA", "TSF"), ("PIK", "VCE"), ("PIK", "TSF")}
+
+
+def test_flight_price_is_none_for_a_malformed_date(stub):
+    assert asyncio.run(prices.get_flight_price("London", "United Kingdom", "Milan", "Italy", "04/05/2030")) is None
+    assert stub.requests == []
+
+
+def test_complete_local_entry_is_resolved_without_autosuggest(stub):
+    codes = asyncio.run(prices.get_city_iata_codes("london", "England"))
+    assert codes == ["LHR", "LGW", "STN", "LTN", "LCY", "SEN"]
+    assert stub.calls("POST", prices.URL_AIRPORTS) == []
+
+
+def test_unknown_city_is_searched_unchanged(stub):
+    stub.add("POST", prices.URL_AIRPORTS, handler=autosuggest([("Ottawa", "Canada", "YOW")]))
+
+    assert asyncio.run(prices.get_city_iata_codes("Ottawa", "Canada")) == ["YOW"]
+    assert searched_terms(stub) == ["Ottawa"]
+
+
+def test_local_entries_only_match_their_own_country(stub):
+    stub.add("POST", prices.URL_AIRPORTS, handler=autosuggest([
+        ("Santiago de Compostela", "Spain", "SCQ"), ("Bern", "Switzerland", "BRN"),
+    ]))
+
+    assert asyncio.run(prices.get_city_iata_codes("Santiago", "Spain")) == ["SCQ"]
+    assert asyncio.run(prices.get_city_iata_codes("Bern", "Switzerland")) == ["BRN"]
+    assert searched_terms(stub) == ["Santiago", "Bern"]
+
+
+def test_failed_autosuggest_is_not_cached(stub):
+    stub.add("POST", prices.URL_AIRPORTS,
+             handler=lambda request: httpx.Response(429, headers={"Retry-After": "0"}, json={}))
+    assert asyncio.run(prices.get_city_iata_codes("Ottawa", "Canada")) == []
+
+    stub.add("POST", prices.URL_AIRPORTS, handler=autosuggest([("Ottawa", "Canada", "YOW")]))
+    assert asyncio.run(prices.get_city_iata_codes("Ottawa", "Canada")) == ["YOW"]
+
+
+def test_partial_local_entry_is_used_when_autosuggest_fails(stub):
+    stub.add("POST", prices.URL_AIRPORTS, handler=lambda request: httpx.Response(400, json={}))
+    assert asyncio.run(prices.get_city_iata_codes("Oslo", "Norway")) == ["OSL"]
+    assert searched_terms(stub) == ["Oslo"]
+
+
+def test_autosuggest_answers_are_filtered_by_city_and_country_and_reused(stub):
+    stub.add("POST", prices.URL_AIRPORTS, handler=autosuggest([
+        ("Valencia", "Spain", "VLC"), ("Valencia", "Venezuela", "VLN"),
+    ]))
+
+    async def resolve_twice():
+        return [await prices.get_city_iata_codes("Valencia", "Spain") for _ in range(2)]
+
+    assert asyncio.run(resolve_twice()) == [["VLC"], ["VLC"]]
+    assert searched_terms(stub) == ["Valencia"]
+
+
+def test_route_quotes_are_shared_and_expire_with_the_quote_store(stub):
+    stub.add("POST", prices.URL_PRICES, handler=indicative_quotes({("MAD", "FCO"): 80}))
+
+    async def quote_concurrently():
+        return await asyncio.gather(*(prices.get_route_quote("MAD", "FCO", 2030, 5, 4) for _ in range(5)))
+
+    assert [q["price"] for q in asyncio.run(quote_concurrently())] == [80] * 5
+    assert asyncio.run(prices.get_route_quote("MAD", "FCO", 2030, 5, 4))["price"] == 80
+    assert len(stub.calls("POST", prices.URL_PRICES)) == 1
+
+    # Once the stored quote expires nothing in memory may outlive it
+    get_quote_cache()._conn.execute("UPDATE quotes SET expires_at = ?", (time.time() - 1,))
+    asyncio.run(prices.get_route_quote("MAD", "FCO", 2030, 5, 4))
+    assert len(stub.calls("POST", prices.URL_PRICES)) == 2
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from backend import main, recommendation
+from backend.recommendation import get_recommender
+
+
+def _groups(recommender, n):
+    features = recommender.base_features
+    groups = []
+    for i in range(n):
+        tags = [{"tag": features[(i + j) % len(features)], "score": 5 - j} for j in range(3)]
+        groups.append(recommender.aggregate_group([{"user": f"u{i}", "tags": tags, "veto": [], "favoured_city": []}]))
+    return groups
+
+
+def test_chunked_batch_ranking_matches_one_pass(monkeypatch):
+    recommender = get_recommender()
+    groups = _groups(recommender, 7)
+    one_pass = recommender.recommend_batch(groups, top_k=5)
+
+    monkeypatch.setattr(recommendation, "RECOMMEND_BATCH_CHUNK", 3)
+    assert recommender.recommend_batch(groups, top_k=5) == one_pass
+    assert [len(r) for r in one_pass] == [5] * 7
+
+
+def test_batch_endpoint_rejects_too_many_groups(monkeypatch):
+    monkeypatch.setattr(main, "MAX_BATCH_GROUPS", 2)
+    group = {"group_id": "g", "preferences": [{"user": "ann", "tags": []}]}
+    response = TestClient(main.app).post("/recommendations/batch", json={"groups": [group] * 3})
+    assert response.status_code == 413
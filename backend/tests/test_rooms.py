@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+from backend import main, rooms
+
+
+def test_reads_of_an_unknown_room_leave_no_directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(rooms, "ROOMS_DIR", str(tmp_path))
+    client = TestClient(main.app)
+
+    assert client.get("/recommendations/", params={"room_id": "zzz"}).status_code == 404
+    assert not (tmp_path / "zzz").exists()
+
+    trip = {"user_id": "ann", "origin_city": "Madrid", "origin_country": "Spain",
+            "start_date": "2030-05-01", "end_date": "2030-05-10"}
+    assert client.post("/sendOriginAndDates/", params={"room_id": "zzz"}, json=trip).status_code == 200
+    assert (tmp_path / "zzz" / "trips.csv").exists()
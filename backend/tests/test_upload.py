@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+from backend import main
+
+LIMIT = 1024
+
+
+def client(monkeypatch):
+    monkeypatch.setattr(main, "IMAGE_MAX_BYTES", LIMIT)
+    for middleware in main.app.user_middleware:
+        if middleware.cls is main.UploadSizeLimit:
+            monkeypatch.setitem(middleware.kwargs, "max_bytes", LIMIT + 512)
+    monkeypatch.setattr(main.app, "middleware_stack", None)
+
+    async def locate(user_id, content, image_data, mime_type, room_id):
+        return {"location": f"{len(image_data)} bytes"}
+
+    monkeypatch.setattr(main, "_locate_image", locate)
+    return TestClient(main.app)
+
+
+def test_upload_within_the_cap_is_located(monkeypatch):
+    response = client(monkeypatch).post("/uploadImage/", data={"user_id": "ann"},
+                                        files={"image": ("a.jpg", b"x" * 100, "image/jpeg")})
+    assert response.status_code == 200
+    assert response.json() == {"location": "100 bytes"}
+
+
+def test_oversized_upload_is_refused_from_content_length(monkeypatch):
+    response = client(monkeypatch).post("/uploadImage/", data={"user_id": "ann"},
+                                        files={"image": ("a.jpg", b"x" * 4 * LIMIT, "image/jpeg")})
+    assert response.status_code == 413
+
+
+def test_oversized_chunked_upload_is_refused_while_streaming(monkeypatch):
+    def body():
+        yield b"--b\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.jpg\"\r\n\r\n"
+        for _ in range(8):
+            yield b"x" * LIMIT
+
+    response = client(monkeypatch).post("/uploadImage/", content=body(),
+                                        headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import time
+
+from backend.jobs import JobQueue
+from backend.message_store import SQLiteMessageStore
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_standalone_worker_finishes_a_queued_job(tmp_path):
+    room_dir = tmp_path / "rooms" / "trip1"
+    room_dir.mkdir(parents=True)
+    (room_dir / "trips.csv").write_text(
+        "user_id,origin_city,origin_country,start_date,end_date\n"
+        "ann,Madrid,Spain,2030-05-01,2030-05-10\n"
+        "bob,Paris,France,2030-05-05,2030-05-12\n"
+    )
+    env = {
+        **os.environ,
+        "ROOMS_DIR": str(tmp_path / "rooms"),
+        "MESSAGE_DB_PATH": str(tmp_path / "messages.db"),
+        "JOB_DB_PATH": str(tmp_path / "jobs.db"),
+        "JOB_POLL_INTERVAL": "0.05",
+        "JOB_WORKERS": "0",
+        "NEGOTIATION_LLM_PHRASING": "0",
+    }
+    queue = JobQueue(env["JOB_DB_PATH"])
+    job, _ = queue.enqueue("negotiation", "trip1")
+
+    worker = subprocess.Popen([sys.executable, "-m", "backend.worker"], cwd=REPO_ROOT, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        deadline = time.monotonic() + 60
+        while queue.get(job["job_id"])["status"] in ("queued", "running") and time.monotonic() < deadline:
+            assert worker.poll() is None, worker.stdout.read()
+            time.sleep(0.1)
+    finally:
+        worker.terminate()
+        output = worker.communicate(timeout=10)[0]
+
+    assert queue.get(job["job_id"])["status"] == "succeeded", output
+    messages = SQLiteMessageStore(env["MESSAGE_DB_PATH"]).list("trip1")
+    assert messages[-1]["content"].startswith("Suggested Dates: 2030-05-05 to 2030-05-10")
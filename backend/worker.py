@@ -0,0 +1,23 @@
+"""Dedicated pipeline worker process: python -m backend.worker
+
+Runs queued jobs from JOB_DB_PATH, for web processes started with
+JOB_WORKERS=0. Runs JOB_WORKERS workers (at least one).
+"""
+import asyncio
+
+from . import orchestrator  # noqa: F401  (registers the pipelines)
+from .jobs import JOB_DB_PATH, JOB_WORKERS, WorkerPool, get_job_queue
+
+
+async def run_worker_process():
+    pool = WorkerPool(get_job_queue(), max(JOB_WORKERS, 1))
+    pool.start()
+    print(f"Job worker {pool.name} running {pool.size} workers on {JOB_DB_PATH}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker_process())
@@ -1,33 +1,81 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { MessageProps } from '@/components/Message';
 import api from '@/lib/axios';
+import { getRoomId } from '@/lib/utils';
 
 export const useChat = (userId: string) => {
   const [messages, setMessages] = useState<MessageProps[]>([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [pipelineStatus, setPipelineStatus] = useState<{ pipeline: string; status: string } | null>(null);
 
   const currentUser = { id: userId, name: 'You', avatar: '' };
 
-  // Fetch messages from the server
+  // Messages confirmed by the server and the last message_id we have seen
+  const serverMessages = useRef<MessageProps[]>([]);
+  const lastMessageId = useRef(0);
+
+  const toMessageProps = (msg: any): MessageProps => ({
+    id: String(msg.message_id),
+    user: { 
+      id: msg.user_id, 
+      name: msg.user_id === userId ? 'You' : 'Other', 
+      avatar: '' 
+    },
+    content: msg.content,
+    timestamp: new Date(msg.timestamp),  // Ensure the response includes a timestamp
+    isCurrentUser: msg.user_id === userId,
+  });
+
+  // Append server messages we have not seen yet, replacing any optimistic local ones
+  const appendServerMessages = (newMessages: any[], firstId?: number) => {
+    let kept = serverMessages.current;
+    if (firstId !== undefined) {
+      // Drop messages the server no longer has (the chat was cleared)
+      kept = kept.filter((msg) => firstId > 0 && Number(msg.id) >= firstId);
+    }
+    const unseen = newMessages.filter((msg) => msg.message_id > lastMessageId.current);
+    serverMessages.current = [...kept, ...unseen.map(toMessageProps)];
+    if (unseen.length > 0) {
+      lastMessageId.current = unseen[unseen.length - 1].message_id;
+    }
+    setMessages(serverMessages.current);
+  };
+
+  // Fetch new messages from the server
   const fetchMessages = async () => {
     try {
-      const response = await api.get(`/getMessages/`);  // Ensure that this matches the FastAPI endpoint
-      const fetchedMessages = response.data.map((msg: any) => ({
-        id: msg.message_id,  // You should ensure the response includes message_id
-        user: { 
-          id: msg.user_id, 
-          name: msg.user_id === userId ? 'You' : 'Other', 
-          avatar: '' 
-        },
-        content: msg.content,
-        timestamp: new Date(msg.timestamp),  // Ensure the response includes a timestamp
-        isCurrentUser: msg.user_id === userId,
-      }));
-      setMessages(fetchedMessages);
+      // Only ask for messages after the last one we have; the server answers 304 when nothing changed
+      const response = await api.get(`/getMessages/`, {
+        params: { after: lastMessageId.current },
+        validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+      });
+      if (response.status === 304) return;
+
+      appendServerMessages(response.data, Number(response.headers['x-first-message-id'] ?? 0));
     } catch (error) {
       console.error('Error fetching messages:', error);
     }
   };
+
+  // Handle an event pushed over the /ws/messages socket
+  const handleEvent = (event: any) => {
+    switch (event.type) {
+      case 'message':
+        appendServerMessages([event.message]);
+        break;
+      case 'status':
+        setPipelineStatus({ pipeline: event.pipeline, status: event.status });
+        break;
+      case 'cleared':
+        serverMessages.current = [];
+        setMessages([]);
+        break;
+      case 'resync':
+        fetchMessages();
+        break;
+    }
+  };
+
   const sendMessage = async (content: string, image?: File) => {
     if (!content.trim() && !image) return; // Don't send empty messages
   
@@ -49,24 +97,12 @@ export const useChat = (userId: string) => {
         if (!content.trim()) {
           content = "Image upload";
       }
-        // Send the image message
-        const base64Image = await convertImageToBase64(image);
-        const userData = {
-          user_id: userId,
-          content: content,
-          image: base64Image,
-        };
-        console.log('Sending image data:', userData); // Log the data being sent
-        // Call the /sendMessageImage endpoint to send the image
-        await api.post(
-          "/sendMessageImage/", 
-          userData,  // Pass userData directly as the body
-          {
-            headers: {
-              "Content-Type": "application/json", // Ensure it's set to application/json
-            }
-          }
-        );
+        // Send the image as a multipart upload (no base64 round trip)
+        const formData = new FormData();
+        formData.append("user_id", userId);
+        formData.append("content", content);
+        formData.append("image", image);
+        await api.post("/uploadImage/", formData);
         
       } else {
         // Send the text message
@@ -89,29 +125,50 @@ export const useChat = (userId: string) => {
   const clearMessages = async () => {
     try {
       await api.get('/clear_chat');
+      serverMessages.current = [];
       setMessages([]);
     } catch (error) {
       console.error('Error clearing messages:', error);
     }
   };
 
-  // Helper function to convert image to base64
-  const convertImageToBase64 = (image: File): Promise<string> => {
-    return new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onloadend = () => resolve(reader.result as string);
-        reader.onerror = reject;
-        reader.readAsDataURL(image);
-    });
-  };
-
-  // Poll messages every 2 seconds
+  // Receive messages over a WebSocket; fall back to polling every 2 seconds while it is down
   useEffect(() => {
-    fetchMessages(); // initial load
+    let socket: WebSocket | null = null;
+    let pollInterval: ReturnType<typeof setInterval> | null = null;
+    let reconnectTimeout: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
 
-    const interval = setInterval(fetchMessages, 2000); // poll every 2s
+    const startPolling = () => {
+      if (!pollInterval) pollInterval = setInterval(fetchMessages, 2000);
+    };
+    const stopPolling = () => {
+      if (pollInterval) clearInterval(pollInterval);
+      pollInterval = null;
+    };
 
-    return () => clearInterval(interval); // cleanup on unmount
+    const connect = () => {
+      const wsUrl = `${(api.defaults.baseURL ?? '').replace(/^http/, 'ws')}/ws/messages?after=${lastMessageId.current}&room_id=${encodeURIComponent(getRoomId())}`;
+      socket = new WebSocket(wsUrl);
+      socket.onopen = stopPolling;
+      socket.onmessage = (msg) => handleEvent(JSON.parse(msg.data));
+      socket.onclose = () => {
+        if (closed) return;
+        startPolling();
+        reconnectTimeout = setTimeout(connect, 5000);
+      };
+    };
+
+    fetchMessages(); // initial load
+    connect();
+
+    return () => {
+      // cleanup on unmount
+      closed = true;
+      stopPolling();
+      if (reconnectTimeout) clearTimeout(reconnectTimeout);
+      socket?.close();
+    };
   }, []);
 
   return {
@@ -120,5 +177,6 @@ export const useChat = (userId: string) => {
     currentUser,
     isLoading,
     clearMessages,
+    pipelineStatus,
   };
 };
@@ -1,7 +1,14 @@
 import axios from 'axios';
+import { getRoomId } from '@/lib/utils';
 
 const api = axios.create({
   baseURL: import.meta.env.VITE_API_URL || 'http://localhost:8000', // Fallback to localhost if the env var is not set
 });
 
+// Scope every request to the current trip group
+api.interceptors.request.use((config) => {
+  config.params = { room_id: getRoomId(), ...config.params };
+  return config;
+});
+
 export default api;
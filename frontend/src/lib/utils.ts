@@ -12,4 +12,14 @@ export function getOrCreateUserId(): string {
     localStorage.setItem("user_id", id);
   }
   return id;
-}
\ No newline at end of file
+}
+
+// The trip group this browser belongs to. Share a link with ?room=<id> to join a group.
+export function getRoomId(): string {
+  const fromUrl = new URLSearchParams(window.location.search).get("room");
+  if (fromUrl) {
+    localStorage.setItem("room_id", fromUrl);
+    return fromUrl;
+  }
+  return localStorage.getItem("room_id") ?? "default";
+}